@@ -0,0 +1,236 @@
+# bulk_io.py - Bulk import kendaraan (CSV / NDJSON) dan streaming export
+import csv
+import io
+import json
+from datetime import datetime
+
+from pydantic import ValidationError
+from sqlalchemy import insert, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+import models, schemas
+from database import SessionLocal
+from fast_response import dumps
+
+FORMAT_CSV = "csv"
+FORMAT_NDJSON = "ndjson"
+
+IMPORT_CHUNK_SIZE = 500
+EXPORT_BATCH_SIZE = 1000
+
+VEHICLE_FIELDS = ("id", "device_id", "vehicle_name", "number_plate", "driver_name", "contact_number")
+TELEMETRY_FIELDS = (
+    "id", "device_id", "timestamp", "count", "lat", "lon", "speed",
+    "ax", "ay", "az", "gx", "gy", "gz", "pitch", "roll", "moving", "total_g",
+    "received_at", "datetime_wib",
+)
+
+MEDIA_TYPES = {FORMAT_CSV: "text/csv", FORMAT_NDJSON: "application/x-ndjson"}
+
+
+def detect_format(requested, content_type):
+    if requested:
+        return requested
+    content_type = (content_type or "").lower()
+    if "csv" in content_type:
+        return FORMAT_CSV
+    return FORMAT_NDJSON
+
+
+async def iter_lines(byte_stream):
+    """Pecah body request (async stream) jadi baris bytes tanpa membaca semuanya sekaligus.
+
+    Decode dilakukan per baris oleh LineParser, supaya byte UTF-8 yang rusak
+    dilaporkan sebagai error baris, bukan menggagalkan seluruh import.
+    """
+    buffer = b""
+    async for chunk in byte_stream:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            yield line.rstrip(b"\r")
+    if buffer:
+        yield buffer.rstrip(b"\r")
+
+
+class LineParser:
+    """Ubah baris CSV / NDJSON jadi (line_number, dict) atau (line_number, error).
+
+    Untuk CSV, field ber-quote yang berisi newline digabung dulu sampai
+    record-nya lengkap (jumlah tanda kutip genap); nomor baris yang
+    dilaporkan adalah baris awal record. Panggil finish() setelah baris
+    terakhir.
+    """
+
+    def __init__(self, fmt):
+        self.fmt = fmt
+        self.header = None
+        self.line_number = 0
+        self._pending = []
+        self._pending_line = None
+        self._pending_quotes = 0
+
+    def parse(self, raw):
+        self.line_number += 1
+        try:
+            line = raw.decode("utf-8-sig") if isinstance(raw, bytes) else raw
+        except UnicodeDecodeError as e:
+            if self._pending:
+                # Record multi-baris yang sedang dikumpulkan ikut gagal
+                line_number = self._pending_line
+                self._pending = []
+                return line_number, f"Invalid UTF-8: {e}"
+            return self.line_number, f"Invalid UTF-8: {e}"
+
+        if self.fmt == FORMAT_CSV:
+            return self._parse_csv(line)
+        if not line.strip():
+            return None
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            return self.line_number, f"Invalid JSON: {e}"
+        if not isinstance(record, dict):
+            return self.line_number, "Expected a JSON object"
+        return self.line_number, record
+
+    def _parse_csv(self, line):
+        if not self._pending:
+            if not line.strip():
+                return None
+            self._pending_line = self.line_number
+            self._pending_quotes = 0
+        self._pending.append(line)
+        self._pending_quotes += line.count('"')
+        if self._pending_quotes % 2:
+            return None  # masih di dalam field ber-quote
+        text = "\n".join(self._pending)
+        line_number = self._pending_line
+        self._pending = []
+
+        try:
+            values = next(csv.reader([text]))
+        except csv.Error as e:
+            return line_number, f"Invalid CSV: {e}"
+        if self.header is None:
+            self.header = [v.strip() for v in values]
+            return None
+        if len(values) != len(self.header):
+            return line_number, f"Expected {len(self.header)} columns, got {len(values)}"
+        return line_number, dict(zip(self.header, values))
+
+    def finish(self):
+        """Error untuk record CSV yang quote-nya tidak pernah ditutup (atau None)"""
+        if not self._pending:
+            return None
+        self._pending = []
+        return self._pending_line, "Unterminated quoted field"
+
+
+def _error(line, device_id, message):
+    return {"line": line, "deviceId": device_id, "error": message}
+
+
+def import_vehicle_chunk(rows, seen_device_ids):
+    """Validasi dan insert satu chunk row.
+
+    rows berisi (line_number, dict | pesan error). Return (inserted, errors).
+    seen_device_ids dipakai untuk mendeteksi duplikat antar chunk dalam file.
+    """
+    errors = []
+    valid = []
+    for line, record in rows:
+        if isinstance(record, str):
+            errors.append(_error(line, None, record))
+            continue
+        try:
+            vehicle = schemas.VehicleCreate(**record)
+        except ValidationError as e:
+            message = "; ".join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors())
+            errors.append(_error(line, record.get("device_id"), message))
+            continue
+        if vehicle.device_id in seen_device_ids:
+            errors.append(_error(line, vehicle.device_id, "Duplicate device_id in file"))
+            continue
+        seen_device_ids.add(vehicle.device_id)
+        valid.append((line, vehicle.dict()))
+
+    if not valid:
+        return 0, errors
+
+    db: Session = SessionLocal()
+    try:
+        existing = {
+            device_id for (device_id,) in db.execute(
+                select(models.Vehicle.device_id).where(
+                    models.Vehicle.device_id.in_([v["device_id"] for _, v in valid])
+                )
+            )
+        }
+        to_insert = []
+        for line, values in valid:
+            if values["device_id"] in existing:
+                errors.append(_error(line, values["device_id"], "Device already registered"))
+            else:
+                to_insert.append((line, values))
+        if not to_insert:
+            return 0, errors
+
+        try:
+            db.execute(insert(models.Vehicle), [values for _, values in to_insert])
+            db.commit()
+            return len(to_insert), errors
+        except IntegrityError:
+            # Bentrok dengan insert lain di tengah jalan: ulangi per row untuk laporan yang tepat
+            db.rollback()
+
+        inserted = 0
+        for line, values in to_insert:
+            try:
+                db.execute(insert(models.Vehicle), [values])
+                db.commit()
+                inserted += 1
+            except IntegrityError as e:
+                db.rollback()
+                errors.append(_error(line, values["device_id"], f"Integrity error: {e.orig}"))
+        return inserted, errors
+    finally:
+        db.close()
+
+
+def _plain(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def stream_rows(query, fields, fmt, batch_size=EXPORT_BATCH_SIZE):
+    """Generator bytes CSV / NDJSON dari server-side cursor.
+
+    Satu batch di-encode sekaligus, jadi memori tetap datar berapapun
+    ukuran tabelnya. Session dibuat sendiri karena generator berjalan
+    setelah dependency request ditutup.
+    """
+    db: Session = SessionLocal()
+    try:
+        if fmt == FORMAT_CSV:
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            writer.writerow(fields)
+            yield buffer.getvalue().encode("utf-8")
+
+        result = db.execute(query.execution_options(stream_results=True, yield_per=batch_size))
+        for batch in result.partitions():
+            if fmt == FORMAT_CSV:
+                buffer = io.StringIO()
+                writer = csv.writer(buffer)
+                writer.writerows([[_plain(v) for v in row] for row in batch])
+                yield buffer.getvalue().encode("utf-8")
+            else:
+                yield b"".join(
+                    dumps({field: _plain(v) for field, v in zip(fields, row)}) + b"\n"
+                    for row in batch
+                )
+    finally:
+        db.close()
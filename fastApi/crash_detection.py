@@ -0,0 +1,36 @@
+# crash_detection.py - Logic KNN crash detection dalam bentuk batch
+import numpy as np
+
+# Urutan fitur harus sama dengan data training crashmodel.pkl
+FEATURE_FIELDS = ("ax", "ay", "az", "gx", "gy", "gz")
+
+
+def feature_matrix(samples):
+    """Matrix (n, 6) dari list sample (MotionPayload / row Payload / dict)"""
+    rows = []
+    for sample in samples:
+        if isinstance(sample, dict):
+            rows.append([float(sample[f]) for f in FEATURE_FIELDS])
+        else:
+            rows.append([float(getattr(sample, f)) for f in FEATURE_FIELDS])
+    return np.array(rows, dtype=float).reshape(-1, len(FEATURE_FIELDS))
+
+
+def predict_batch(model, features):
+    """Prediksi accident untuk satu batch fitur.
+
+    Return (is_accident, confidence), dua array sepanjang jumlah baris.
+    confidence adalah probabilitas kelas accident.
+    """
+    prediction = np.asarray(model.predict(features))
+    is_accident = prediction == 1
+
+    if hasattr(model, 'predict_proba'):
+        proba = np.asarray(model.predict_proba(features))
+        classes = list(getattr(model, 'classes_', [0, 1]))
+        column = classes.index(1) if 1 in classes else proba.shape[1] - 1
+        confidence = proba[:, column]
+    else:
+        confidence = is_accident.astype(float)
+
+    return is_accident, confidence
@@ -0,0 +1,179 @@
+# driving_rules.py - Rule engine untuk speeding, harsh braking dan sharp cornering
+import threading
+from dataclasses import dataclass
+
+import numpy as np
+
+import models
+from database import SessionLocal
+from versions import data_versions
+
+SPEEDING = "speeding"
+HARSH_BRAKING = "harsh_braking"
+SHARP_CORNERING = "sharp_cornering"
+RULE_TYPES = (SPEEDING, HARSH_BRAKING, SHARP_CORNERING)
+SEVERITIES = ("low", "medium", "high", "critical")
+
+# Deceleration dari dua sample berurutan hanya dihitung kalau jaraknya wajar
+MAX_SAMPLE_GAP_SECONDS = 10
+
+
+@dataclass
+class RuleHit:
+    index: int          # posisi sample di batch
+    device_id: str
+    rule_type: str
+    value: float
+    threshold: float
+    severity: str
+
+
+class CompiledRules:
+    """Rule yang sudah di-compile jadi tabel threshold per device.
+
+    Threshold per rule type disimpan sebagai array yang di-index dengan
+    posisi device, jadi evaluasi satu batch hanya beberapa operasi numpy
+    berapapun jumlah rule-nya. NaN berarti rule tidak aktif.
+    """
+
+    def __init__(self, rules, version):
+        self.version = version
+        self._defaults = {t: (np.nan, "medium") for t in RULE_TYPES}
+        self._overrides = {t: {} for t in RULE_TYPES}
+        for rule in rules:
+            if rule.rule_type not in RULE_TYPES:
+                continue
+            value = (rule.threshold if rule.enabled else np.nan, rule.severity)
+            if rule.device_id is None:
+                self._defaults[rule.rule_type] = value
+            else:
+                self._overrides[rule.rule_type][rule.device_id] = value
+        self.empty = not rules or all(
+            np.isnan(self._defaults[t][0])
+            and all(np.isnan(v[0]) for v in self._overrides[t].values())
+            for t in RULE_TYPES
+        )
+
+    def lookup(self, rule_type, devices):
+        """(threshold array, severity list) untuk daftar device unik"""
+        default = self._defaults[rule_type]
+        overrides = self._overrides[rule_type]
+        values = [overrides.get(d, default) for d in devices]
+        return np.array([v[0] for v in values], dtype=float), [v[1] for v in values]
+
+
+class RuleEngine:
+    """Evaluasi driving rule secara vectorized untuk satu batch sample.
+
+    Rule di-compile ulang hanya kalau versi tabel rules berubah (di worker
+    manapun), state kecepatan terakhir per device disimpan di memori untuk
+    menghitung deceleration antar sample.
+    """
+
+    def __init__(self):
+        self._compiled = None
+        self._compile_lock = threading.Lock()
+        self._state_lock = threading.Lock()
+        # device_id -> (timestamp, speed) sample terakhir
+        self._last = {}
+
+    def compiled(self):
+        version = data_versions.get("rules")
+        compiled = self._compiled
+        if compiled is not None and compiled.version == version:
+            return compiled
+        with self._compile_lock:
+            if self._compiled is None or self._compiled.version != version:
+                db = SessionLocal()
+                try:
+                    rules = db.query(models.DrivingRule).all()
+                finally:
+                    db.close()
+                self._compiled = CompiledRules(rules, version)
+                print(f"[RULES] Compiled {len(rules)} driving rules (version {version})")
+            return self._compiled
+
+    def _previous(self, devices, inverse, timestamps, speeds):
+        """Timestamp dan speed sample sebelumnya per sample (NaN kalau tidak ada).
+
+        Di dalam batch diambil dari sample device yang sama sebelumnya, untuk
+        sample pertama tiap device dari state yang tersimpan.
+        """
+        n = len(inverse)
+        order = np.lexsort((np.arange(n), inverse))
+        sorted_inverse = inverse[order]
+        first = np.ones(n, dtype=bool)
+        first[1:] = sorted_inverse[1:] != sorted_inverse[:-1]
+
+        prev_ts = np.empty(n)
+        prev_speed = np.empty(n)
+        prev_ts[1:] = timestamps[order][:-1]
+        prev_speed[1:] = speeds[order][:-1]
+
+        with self._state_lock:
+            for position in np.flatnonzero(first):
+                last = self._last.get(devices[sorted_inverse[position]], (np.nan, np.nan))
+                prev_ts[position], prev_speed[position] = last
+            # Simpan sample terbaru tiap device untuk batch berikutnya
+            last_positions = np.append(np.flatnonzero(first)[1:] - 1, n - 1)
+            for position in last_positions:
+                index = order[position]
+                device = devices[sorted_inverse[position]]
+                stored = self._last.get(device)
+                if stored is None or timestamps[index] >= stored[0]:
+                    self._last[device] = (timestamps[index], speeds[index])
+
+        result_ts = np.empty(n)
+        result_speed = np.empty(n)
+        result_ts[order] = prev_ts
+        result_speed[order] = prev_speed
+        return result_ts, result_speed
+
+    def evaluate(self, samples):
+        """Return list RuleHit untuk batch sample (urutan sesuai masuk)"""
+        compiled = self.compiled()
+        if compiled.empty or not samples:
+            return []
+
+        devices, inverse = np.unique([s.device for s in samples], return_inverse=True)
+        timestamps = np.array([s.timestamp for s in samples], dtype=float)
+        speeds = np.array([s.speed for s in samples], dtype=float)
+        ay = np.array([s.ay for s in samples], dtype=float)
+        gz = np.array([s.gz for s in samples], dtype=float)
+
+        prev_ts, prev_speed = self._previous(devices, inverse, timestamps, speeds)
+        dt = timestamps - prev_ts
+        valid_gap = (dt > 0) & (dt <= MAX_SAMPLE_GAP_SECONDS)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            # km/h per detik -> m/s^2
+            speed_decel = np.where(valid_gap, (prev_speed - speeds) / 3.6 / dt, np.nan)
+        # ay negatif = deceleration longitudinal
+        deceleration = np.fmax(speed_decel, -ay)
+
+        measured = {
+            SPEEDING: speeds,
+            HARSH_BRAKING: deceleration,
+            SHARP_CORNERING: np.abs(gz),
+        }
+
+        hits = []
+        for rule_type, values in measured.items():
+            thresholds, severities = compiled.lookup(rule_type, devices)
+            per_sample = thresholds[inverse]
+            with np.errstate(invalid="ignore"):
+                triggered = values > per_sample
+            for index in np.flatnonzero(triggered):
+                device_index = inverse[index]
+                hits.append(RuleHit(
+                    index=int(index),
+                    device_id=str(devices[device_index]),
+                    rule_type=rule_type,
+                    value=float(values[index]),
+                    threshold=float(thresholds[device_index]),
+                    severity=severities[device_index],
+                ))
+        hits.sort(key=lambda hit: hit.index)
+        return hits
+
+
+rule_engine = RuleEngine()
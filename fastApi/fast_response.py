@@ -0,0 +1,100 @@
+# fast_response.py - Fast path untuk endpoint dashboard (encoder cepat, columnar, kompresi, ETag)
+import gzip
+import json
+
+from fastapi import Request
+from fastapi.responses import Response
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Response kecil tidak perlu dikompres, overhead-nya lebih besar dari hasilnya
+MIN_COMPRESS_SIZE = 1024
+GZIP_LEVEL = 5
+BROTLI_QUALITY = 4
+
+FORMAT_JSON = "json"          # default, response lama (list of dict)
+FORMAT_FAST = "fast"          # list of dict, encoder cepat + kompresi + ETag
+FORMAT_COLUMNAR = "columnar"  # satu array per field + kompresi + ETag
+FORMATS = (FORMAT_JSON, FORMAT_FAST, FORMAT_COLUMNAR)
+
+
+def dumps(data):
+    """Serialize ke JSON bytes, pakai orjson kalau tersedia"""
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+def to_columnar(rows, fields):
+    """Ubah list of dict jadi {"fields": [...], "columns": {field: [...]}, "count": n}"""
+    return {
+        "fields": list(fields),
+        "columns": {field: [row[field] for row in rows] for field in fields},
+        "count": len(rows),
+    }
+
+
+def weak_etag(etag: str):
+    """ETag weak (W/"...").
+
+    Body yang sama dikirim sebagai identity, gzip atau br, jadi validator
+    strong tidak boleh dipakai untuk semua content-coding tersebut.
+    """
+    return etag if etag.startswith("W/") else "W/" + etag
+
+
+def not_modified(request: Request, etag: str):
+    """Return 304 kalau If-None-Match cocok dengan ETag saat ini, selain itu None.
+
+    Perbandingan memakai weak comparison (RFC 9110), prefix W/ diabaikan.
+    """
+    header = request.headers.get("if-none-match")
+    if not header:
+        return None
+    opaque = weak_etag(etag)[2:]
+    candidates = [tag.strip() for tag in header.split(",")]
+    if "*" in candidates or any(tag.removeprefix("W/") == opaque for tag in candidates):
+        return Response(status_code=304, headers={"ETag": weak_etag(etag), "Vary": "Accept-Encoding"})
+    return None
+
+
+def _negotiate_encoding(request: Request):
+    accept = request.headers.get("accept-encoding", "")
+    offered = set()
+    for part in accept.split(","):
+        token, _, params = part.strip().partition(";")
+        if params.strip().replace(" ", "") in ("q=0", "q=0.0"):
+            continue
+        offered.add(token.strip().lower())
+    if brotli is not None and "br" in offered:
+        return "br"
+    if "gzip" in offered:
+        return "gzip"
+    return None
+
+
+def encoded_response(request: Request, data, etag: str = None):
+    """Response JSON dengan encoder cepat, kompresi gzip/br dan ETag"""
+    body = dumps(data)
+    headers = {"Vary": "Accept-Encoding"}
+    if etag:
+        headers["ETag"] = weak_etag(etag)
+        headers["Cache-Control"] = "no-cache"
+
+    encoding = _negotiate_encoding(request) if len(body) >= MIN_COMPRESS_SIZE else None
+    if encoding == "br":
+        body = brotli.compress(body, quality=BROTLI_QUALITY)
+        headers["Content-Encoding"] = "br"
+    elif encoding == "gzip":
+        body = gzip.compress(body, compresslevel=GZIP_LEVEL)
+        headers["Content-Encoding"] = "gzip"
+
+    return Response(content=body, media_type="application/json", headers=headers)
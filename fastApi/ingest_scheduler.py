@@ -0,0 +1,234 @@
+# ingest_scheduler.py - Priority lane + load shedding untuk ingest MQTT
+import threading
+import time
+import zlib
+from collections import deque
+
+# Nilai sensor di atas ini dianggap "accident range" (skala sama dengan dummy.py)
+HIGH_PRIORITY_TOTAL_G = 15.0
+HIGH_PRIORITY_ACCEL = 15.0
+HIGH_PRIORITY_GYRO = 200.0
+# Setelah sample high priority, sample device yang sama selama window ini
+# juga masuk lane high (data pasca-kejadian relevan untuk alert)
+INCIDENT_WINDOW_SECONDS = 30.0
+
+HIGH_WORKERS = 2
+NORMAL_WORKERS = 4
+# Kapasitas per worker; lane high yang penuh di-spill ke spool, tidak di-drop
+HIGH_QUEUE_SIZE = 5000
+NORMAL_QUEUE_SIZE = 5000
+# Di atas backlog ini, update posisi rutin di-coalesce per device
+COALESCE_THRESHOLD = 200
+# Sample high priority yang gagal diproses di-retry, lalu di-spill ke spool;
+# kalau spool juga penuh, worker terus retry (tidak pernah di-drop)
+HIGH_RETRY_ATTEMPTS = 3
+HIGH_RETRY_SLEEP = 0.5
+HIGH_RETRY_MAX_SLEEP = 10.0
+
+
+def is_accident_range(sample):
+    if sample.total_g >= HIGH_PRIORITY_TOTAL_G:
+        return True
+    if max(abs(sample.ax), abs(sample.ay), abs(sample.az)) >= HIGH_PRIORITY_ACCEL:
+        return True
+    return max(abs(sample.gx), abs(sample.gy), abs(sample.gz)) >= HIGH_PRIORITY_GYRO
+
+
+class _Lane:
+    """Queue FIFO milik satu worker, dengan coalescing per device (opsional).
+
+    Saat backlog melewati coalesce_after, sample baru dari device yang masih
+    punya sample menunggu di queue menggantikan sample lama tersebut (posisi
+    di queue tetap, isinya yang terbaru).
+    """
+
+    def __init__(self, maxsize, coalesce_after=None):
+        self.maxsize = maxsize
+        self.coalesce_after = coalesce_after
+        self._items = deque()
+        self._waiting = {}
+        lock = threading.Lock()
+        self._not_empty = threading.Condition(lock)
+        self._not_full = threading.Condition(lock)
+
+    def put(self, device, item, block=False):
+        """Return "queued", "coalesced" atau "full".
+
+        block=True menunggu sampai ada ruang (tidak pernah return "full").
+        """
+        with self._not_empty:
+            while True:
+                backlog = len(self._items)
+                if self.coalesce_after is not None and backlog >= self.coalesce_after:
+                    slot = self._waiting.get(device)
+                    if slot is not None:
+                        slot[1] = item
+                        return "coalesced"
+                if backlog < self.maxsize:
+                    break
+                if not block:
+                    return "full"
+                self._not_full.wait()
+            slot = [device, item]
+            self._items.append(slot)
+            self._waiting[device] = slot
+            self._not_empty.notify()
+            return "queued"
+
+    def get(self):
+        with self._not_empty:
+            while not self._items:
+                self._not_empty.wait()
+            slot = self._items.popleft()
+            if self._waiting.get(slot[0]) is slot:
+                del self._waiting[slot[0]]
+            self._not_full.notify()
+            return slot[1]
+
+    def __len__(self):
+        return len(self._items)
+
+
+class IngestScheduler:
+    """Memisahkan ingest ke lane high priority dan normal.
+
+    - Lane high: sample accident-range + sample dalam incident window,
+      punya worker sendiri dan tidak pernah di-drop: kalau lane penuh
+      di-spill ke spool, kalau spool juga penuh submit menunggu ruang di
+      lane; sample yang gagal diproses di-retry lalu di-spill.
+    - Lane normal: update posisi rutin, di-coalesce per device saat backlog
+      tinggi dan di-shed kalau queue penuh.
+
+    Sample di-shard ke worker berdasarkan device, jadi urutan per device di
+    dalam satu lane tetap terjaga.
+    """
+
+    def __init__(self, handle, spill, high_workers=HIGH_WORKERS, normal_workers=NORMAL_WORKERS):
+        self.handle = handle
+        self.spill = spill
+        self._high = [_Lane(HIGH_QUEUE_SIZE) for _ in range(high_workers)]
+        self._normal = [_Lane(NORMAL_QUEUE_SIZE, COALESCE_THRESHOLD) for _ in range(normal_workers)]
+        self._incident_until = {}
+        self._lock = threading.Lock()
+        self._started = False
+        self.counters = {
+            "highQueued": 0,
+            "highSpilled": 0,
+            "highBlocked": 0,
+            "highRetries": 0,
+            "normalQueued": 0,
+            "coalesced": 0,
+            "shed": 0,
+            "processedHigh": 0,
+            "processedNormal": 0,
+            "errors": 0,
+        }
+
+    def start(self):
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        for i, lane in enumerate(self._high):
+            threading.Thread(target=self._work_high, args=(lane,), name=f"ingest-high-{i}", daemon=True).start()
+        for i, lane in enumerate(self._normal):
+            threading.Thread(target=self._work_normal, args=(lane,), name=f"ingest-normal-{i}", daemon=True).start()
+        print(f"[INGEST] Scheduler started ({len(self._high)} high + {len(self._normal)} normal workers)")
+
+    def _count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+
+    def is_high_priority(self, sample):
+        now = time.monotonic()
+        if is_accident_range(sample):
+            with self._lock:
+                self._incident_until[sample.device] = now + INCIDENT_WINDOW_SECONDS
+            return True
+        with self._lock:
+            until = self._incident_until.get(sample.device)
+            if until is None:
+                return False
+            if now < until:
+                return True
+            del self._incident_until[sample.device]
+            return False
+
+    @staticmethod
+    def _shard(lanes, device):
+        return lanes[zlib.crc32(device.encode()) % len(lanes)]
+
+    def submit(self, raw: bytes, sample):
+        self.start()
+        if self.is_high_priority(sample):
+            lane = self._shard(self._high, sample.device)
+            if lane.put(sample.device, (raw, sample)) != "full":
+                self._count("highQueued")
+                return
+            # High priority tidak pernah di-drop: tulis ke spool lokal
+            try:
+                self.spill(raw, sample)
+                self._count("highSpilled")
+                print(f"[INGEST] ⚠️ High lane full, {sample.device} sample spilled to spool")
+            except Exception as e:
+                # Spool juga penuh: tahan thread MQTT sampai lane punya ruang
+                self._count("highBlocked")
+                print(f"[INGEST] ⚠️ High lane and spool full ({e}), waiting for lane space")
+                lane.put(sample.device, (raw, sample), block=True)
+                self._count("highQueued")
+            return
+
+        result = self._shard(self._normal, sample.device).put(sample.device, (raw, sample))
+        if result == "queued":
+            self._count("normalQueued")
+        elif result == "coalesced":
+            self._count("coalesced")
+        else:
+            self._count("shed")
+
+    def _work_normal(self, lane):
+        while True:
+            raw, sample = lane.get()
+            try:
+                self.handle(raw, sample, False)
+                self._count("processedNormal")
+            except Exception as e:
+                self._count("errors")
+                print(f"[INGEST] ❌ Error handling {sample.device}: {e}")
+
+    def _work_high(self, lane):
+        while True:
+            raw, sample = lane.get()
+            self._process_critical(raw, sample)
+
+    def _process_critical(self, raw, sample):
+        """Proses sample high priority sampai berhasil ditulis atau di-spool"""
+        attempt = 0
+        while True:
+            try:
+                self.handle(raw, sample, True)
+                self._count("processedHigh")
+                return
+            except Exception as e:
+                attempt += 1
+                self._count("highRetries")
+                print(f"[INGEST] ⚠️ Error handling high priority {sample.device} (attempt {attempt}): {e}")
+            if attempt >= HIGH_RETRY_ATTEMPTS:
+                try:
+                    self.spill(raw, sample)
+                    self._count("highSpilled")
+                    return
+                except Exception as e:
+                    print(f"[INGEST] ❌ Cannot spill {sample.device} sample, retrying: {e}")
+            time.sleep(min(HIGH_RETRY_SLEEP * 2 ** (attempt - 1), HIGH_RETRY_MAX_SLEEP))
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self.counters)
+            incidents = len(self._incident_until)
+        return {
+            **counters,
+            "highBacklog": sum(len(lane) for lane in self._high),
+            "normalBacklog": sum(len(lane) for lane in self._normal),
+            "devicesInIncidentWindow": incidents,
+        }
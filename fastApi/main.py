@@ -1,19 +1,31 @@
 # main.py - COMPLETE dengan Manual Cascade Delete Fixed + WIB Support
-from fastapi import FastAPI, Depends, HTTPException
+from fastapi import FastAPI, Depends, HTTPException, Request
+from sqlalchemy import insert, select, text
+from sqlalchemy.exc import DataError, IntegrityError, SQLAlchemyError
 from sqlalchemy.orm import Session
-from database import SessionLocal, engine
+from database import SessionLocal
 import models, schemas
+import fast_response
+from versions import data_versions
+from response_cache import response_cache
+from model_registry import model_registry, ModelNotFound, ModelLoadError
+from crash_detection import feature_matrix, predict_batch
+from spool import SpoolingSink
+from ingest_scheduler import IngestScheduler
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
+import bulk_io
+from driving_rules import rule_engine, RULE_TYPES, SEVERITIES
 
 import json
 import paho.mqtt.client as mqtt
 import threading
+import time
 from datetime import datetime, timedelta
-from typing import List
-import joblib
-import numpy as np
+from typing import List, Optional
 
-models.Base.metadata.create_all(bind=engine)
+# Schema dibuat lewat `python manage.py init-db`, bukan saat import
 
 app = FastAPI()
 
@@ -34,19 +46,12 @@ MQTT_TOPIC = "esp32/tracker/data"
 # ML MODEL LOADING
 # ============================
 
-try:
-    crash_model = joblib.load("crashmodel.pkl")
-    print("[ML] ✅ Crash detection model loaded successfully")
-    print(f"[ML] Model type: {type(crash_model)}")
-    has_proba = hasattr(crash_model, 'predict_proba')
-    print(f"[ML] Probability support: {has_proba}")
-    
-    if hasattr(crash_model, 'n_features_in_'):
-        print(f"[ML] Expected features: {crash_model.n_features_in_}")
-    
-except Exception as e:
-    print(f"[ML] ❌ Failed to load crash model: {e}")
-    crash_model = None
+# Model di-load (mmap) dan di-warm-up di background thread saat startup,
+# lihat model_loader.py. Model aktif dipilih lewat model_registry.py
+
+@app.on_event("startup")
+def warm_up_crash_model():
+    model_registry.warm_up()
 
 def get_db():
     db = SessionLocal()
@@ -62,27 +67,32 @@ def get_db():
 def extract_features_for_crash_detection(payload_data):
     """Extract 6 features for KNN crash detection model"""
     try:
-        features = [
-            float(payload_data.ax),      # Ax
-            float(payload_data.ay),      # Ay  
-            float(payload_data.az),      # Az
-            float(payload_data.gx),      # Gx
-            float(payload_data.gy),      # Gy
-            float(payload_data.gz)       # Gz
-        ]
+        features = feature_matrix([payload_data])
         
-        print(f"[ML] Extracted 6 features for {payload_data.device}: {features}")
-        return np.array(features).reshape(1, -1)
+        print(f"[ML] Extracted 6 features for {payload_data.device}: {features[0].tolist()}")
+        return features
         
     except Exception as e:
         print(f"[ML] Error extracting features: {e}")
         return None
 
+def detect_accident_batch(features):
+    """Score satu batch fitur dengan model aktif.
+
+    Batch yang sama diteruskan ke shadow model (kalau ada) di background.
+    Return (is_accident, confidence) array, atau None kalau model belum ada.
+    """
+    version, crash_model = model_registry.active()
+    if crash_model is None:
+        return None
+
+    started = time.perf_counter()
+    is_accident, confidence = predict_batch(crash_model, features)
+    model_registry.record(version, features, is_accident, time.perf_counter() - started)
+    return is_accident, confidence
+
 def detect_accident(payload_data):
     """Detect accident using KNN model with 6 features"""
-    if crash_model is None:
-        return False, 0.0, "Model not loaded"
-    
     try:
         features = extract_features_for_crash_detection(payload_data)
         if features is None:
@@ -90,14 +100,11 @@ def detect_accident(payload_data):
         
         print(f"[ML] Features shape: {features.shape} for {payload_data.device}")
         
-        prediction = crash_model.predict(features)[0]
-        is_accident = prediction == 1
-        
-        if hasattr(crash_model, 'predict_proba'):
-            proba = crash_model.predict_proba(features)[0]
-            confidence = proba[1]
-        else:
-            confidence = 1.0 if is_accident else 0.0
+        result = detect_accident_batch(features)
+        if result is None:
+            return False, 0.0, "Model not loaded"
+        is_accident = bool(result[0][0])
+        confidence = float(result[1][0])
         
         if is_accident:
             print(f"[ML] 🚨 ACCIDENT DETECTED for {payload_data.device}!")
@@ -150,6 +157,7 @@ def create_accident_alert(db: Session, device_id: str, payload_data, confidence:
         db.add(alert)
         db.commit()
         db.refresh(alert)
+        response_cache.invalidate(("alerts",), keys=[ALERT_STATS_KEY])
         
         print(f"[ALERT] ✅ Accident alert created for {device_id} with {severity} severity")
         return alert
@@ -159,6 +167,71 @@ def create_accident_alert(db: Session, device_id: str, payload_data, confidence:
         db.rollback()
         return None
 
+def has_recent_alert(db: Session, device_id: str, alert_type: str, now: datetime):
+    """Cooldown alert: sudah ada alert aktif dengan tipe sama dalam 2 menit terakhir"""
+    return db.query(models.Alert).filter(
+        models.Alert.device_id == device_id,
+        models.Alert.alert_type == alert_type,
+        models.Alert.is_active == True,
+        models.Alert.created_at >= now - timedelta(minutes=2)
+    ).first() is not None
+
+RULE_ALERT_UNITS = {"speeding": "km/h", "harsh_braking": "m/s²", "sharp_cornering": "°/s"}
+
+def create_rule_alert(db: Session, payload_data, hit):
+    """Create driving rule alert (speeding / harsh braking / sharp cornering)"""
+    try:
+        vehicle = db.query(models.Vehicle).filter(models.Vehicle.device_id == hit.device_id).first()
+        if not vehicle:
+            return None
+
+        unit = RULE_ALERT_UNITS[hit.rule_type]
+        label = hit.rule_type.replace("_", " ").capitalize()
+        alert = models.Alert(
+            device_id=hit.device_id,
+            alert_type=hit.rule_type,
+            severity=hit.severity,
+            message=f"{label} detected for {vehicle.vehicle_name}: {hit.value:.1f} {unit} (limit {hit.threshold:.1f} {unit})",
+            lat=payload_data.lat,
+            lon=payload_data.lon,
+            sensor_data=json.dumps({
+                'speed': payload_data.speed,
+                'ay': payload_data.ay,
+                'gz': payload_data.gz,
+                'value': hit.value,
+                'threshold': hit.threshold
+            }),
+            is_active=True
+        )
+
+        db.add(alert)
+        db.commit()
+        db.refresh(alert)
+        response_cache.invalidate(("alerts",), keys=[ALERT_STATS_KEY])
+
+        print(f"[ALERT] ✅ {label} alert created for {hit.device_id} with {hit.severity} severity")
+        return alert
+
+    except Exception as e:
+        print(f"[ALERT] ❌ Error creating {hit.rule_type} alert: {e}")
+        db.rollback()
+        return None
+
+def apply_driving_rules(db: Session, samples, now: datetime):
+    """Evaluasi driving rules untuk satu batch sample dan buat alert-nya.
+
+    Satu alert per (device, rule) per batch, dengan cooldown yang sama
+    seperti alert accident.
+    """
+    seen = set()
+    for hit in rule_engine.evaluate(samples):
+        key = (hit.device_id, hit.rule_type)
+        if key in seen:
+            continue
+        seen.add(key)
+        if not has_recent_alert(db, hit.device_id, hit.rule_type, now):
+            create_rule_alert(db, samples[hit.index], hit)
+
 # ============================
 # MQTT HANDLER - UPDATED UNTUK WIB
 # ============================
@@ -177,6 +250,20 @@ def on_message(client, userdata, msg):
         print("[MQTT] Invalid payload:", e, payload_raw)
         return
 
+    ingest_scheduler.submit(msg.payload, schema)
+
+def handle_sample(raw, schema, critical=False):
+    ingest_sink.submit(raw, schema, (SQLAlchemyError,), critical)
+
+def history_row(sample, now):
+    """Kolom untuk tabel telemetry_history dari satu sample"""
+    return {"device_id": sample.device, "received_at": now, **sample.dict(exclude={"device"})}
+
+def store_sample(schema):
+    """Tulis satu sample ke database (accident detection + history + update payload).
+
+    Error database di-raise ke pemanggil supaya sample bisa masuk spool.
+    """
     db: Session = SessionLocal()
     try:
         vehicle = db.query(models.Vehicle).filter(models.Vehicle.device_id == schema.device).first()
@@ -190,22 +277,28 @@ def on_message(client, userdata, msg):
         is_accident, confidence, status = detect_accident(schema)
         
         if is_accident:
-            recent_alert = db.query(models.Alert).filter(
-                models.Alert.device_id == schema.device,
-                models.Alert.alert_type == "accident",
-                models.Alert.is_active == True,
-                models.Alert.created_at >= now - timedelta(minutes=2)
-            ).first()
-            
-            if not recent_alert:
+            if not has_recent_alert(db, schema.device, "accident", now):
                 create_accident_alert(db, schema.device, schema, confidence)
 
+        # Driving rules (speeding, harsh braking, sharp cornering)
+        apply_driving_rules(db, [schema], now)
+
+        # History menyimpan setiap sample, throttle di bawah hanya untuk row payload
+        db.add(models.TelemetryHistory(**history_row(schema, now)))
+
         # Update payload data
         existing = db.query(models.Payload).filter(models.Payload.device_id == schema.device).first()
 
         if existing:
+            # Lane high bisa mendahului lane normal; jangan timpa dengan sample lama
+            if schema.timestamp < existing.timestamp:
+                db.commit()
+                print(f"[MQTT] {schema.device} | Update skipped (older sample)")
+                return
+
             time_diff = now - existing.updated_at
             if time_diff.total_seconds() < 10:
+                db.commit()
                 print(f"[MQTT] {schema.device} | Update skipped (<10s)")
                 return
 
@@ -232,6 +325,7 @@ def on_message(client, userdata, msg):
                 print(f"[MQTT] {schema.device} | WIB Time: {schema.datetime_wib}")
             
             db.commit()
+            response_cache.invalidate(("payload",), keys=[MAP_KEY])
         else:
             new_payload = models.Payload(
                 device_id=schema.device,
@@ -256,17 +350,117 @@ def on_message(client, userdata, msg):
             )
             db.add(new_payload)
             db.commit()
+            response_cache.invalidate(("payload",), keys=[MAP_KEY])
             
             if new_payload.datetime_wib:
                 print(f"[MQTT] New data for {schema.device} with WIB time: {new_payload.datetime_wib}")
             else:
                 print(f"[MQTT] Data updated for {schema.device}")
-    except Exception as e:
+    except SQLAlchemyError as e:
         print(f"[MQTT] Database error for {schema.device}: {e}")
+        db.rollback()
+        raise
+    except Exception as e:
+        print(f"[MQTT] Error processing {schema.device}: {e}")
     finally:
         db.close()
 
+def store_samples_batch(samples, received_times=None):
+    """Tulis banyak sample sekaligus (dipakai replayer spool).
+
+    Sample diproses sesuai urutan masuk: accident detection dijalankan
+    sebagai satu batch, semua sample masuk telemetry_history dengan satu
+    bulk insert, lalu row payload tiap device di-update sekali dengan sample
+    terbaru dan di-commit dalam satu transaksi.
+
+    received_times (epoch, dari spool) dipakai sebagai received_at di
+    history, supaya backlog setelah outage tidak menumpuk di waktu replay.
+    """
+    db: Session = SessionLocal()
+    try:
+        device_ids = {s.device for s in samples}
+        registered = {
+            device_id for (device_id,) in
+            db.query(models.Vehicle.device_id).filter(models.Vehicle.device_id.in_(device_ids))
+        }
+        now = datetime.utcnow()
+        if received_times is None:
+            received = [now] * len(samples)
+        else:
+            received = [datetime.utcfromtimestamp(t) for t in received_times]
+        kept = [(s, at) for s, at in zip(samples, received) if s.device in registered]
+        if not kept:
+            return
+        samples = [s for s, _ in kept]
+
+        result = detect_accident_batch(feature_matrix(samples))
+        if result is not None:
+            for sample, is_accident, confidence in zip(samples, result[0], result[1]):
+                if not is_accident:
+                    continue
+                if not has_recent_alert(db, sample.device, "accident", now):
+                    create_accident_alert(db, sample.device, sample, float(confidence))
+
+        apply_driving_rules(db, samples, now)
+
+        db.execute(insert(models.TelemetryHistory), [history_row(s, at) for s, at in kept])
+
+        # Sample terakhir per device menang, urutan per device tetap terjaga
+        latest = {}
+        for sample in samples:
+            latest[sample.device] = sample
+        existing = {
+            p.device_id: p for p in
+            db.query(models.Payload).filter(models.Payload.device_id.in_(latest.keys()))
+        }
+        for device_id, sample in latest.items():
+            fields = sample.dict(exclude={"device"})
+            row = existing.get(device_id)
+            if row is None:
+                db.add(models.Payload(device_id=device_id, updated_at=now, **fields))
+            elif sample.timestamp >= row.timestamp:
+                for field, value in fields.items():
+                    if field == "datetime_wib" and not value:
+                        continue
+                    setattr(row, field, value)
+                row.updated_at = now
+        db.commit()
+        response_cache.invalidate(("payload",), keys=[MAP_KEY])
+        print(f"[MQTT] Bulk stored {len(samples)} samples for {len(latest)} devices")
+    except SQLAlchemyError:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+def db_ping():
+    db: Session = SessionLocal()
+    try:
+        db.execute(text("SELECT 1"))
+        return True
+    except Exception:
+        return False
+    finally:
+        db.close()
+
+def decode_spooled(raw):
+    return schemas.MotionPayload(**json.loads(raw))
+
+ingest_sink = SpoolingSink(
+    write_one=store_sample,
+    write_batch=store_samples_batch,
+    health_check=db_ping,
+    decode=decode_spooled,
+    # Hanya error karena isi record yang membuat record spool dibuang
+    poison_errors=(IntegrityError, DataError),
+)
+
+ingest_scheduler = IngestScheduler(handle=handle_sample, spill=ingest_sink.spill)
+
 def mqtt_worker():
+    # Tunggu model siap (load mmap + warm-up) sebelum menerima sample, supaya
+    # waktu load tidak terhitung sebagai write DB yang lambat di SpoolingSink
+    model_registry.active()
     client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
     client.on_connect = on_connect
     client.on_message = on_message
@@ -275,6 +469,8 @@ def mqtt_worker():
 
 @app.on_event("startup")
 def start_mqtt():
+    ingest_sink.start()
+    ingest_scheduler.start()
     thread = threading.Thread(target=mqtt_worker, daemon=True)
     thread.start()
     print("[MQTT] Worker thread started")
@@ -283,16 +479,95 @@ def start_mqtt():
 # VEHICLE ENDPOINTS
 # ============================
 
+# Key response cache, di-invalidate oleh write path yang mengubah datanya
+VEHICLE_LIST_KEY = ("vehicles",)
+ALERT_STATS_KEY = ("alert_stats",)
+MAP_KEY = ("dashboard_map",)
+
+def vehicle_key(vehicle_id: int):
+    return ("vehicle", vehicle_id)
+
 @app.get("/vehicles", response_model=List[schemas.VehicleResponse])
 def get_vehicles(db: Session = Depends(get_db)):
-    return db.query(models.Vehicle).all()
+    return response_cache.get_or_load(
+        VEHICLE_LIST_KEY, ("vehicles",),
+        lambda: [schemas.VehicleResponse.model_validate(v) for v in db.query(models.Vehicle).all()],
+    )
+
+@app.get("/vehicles/export")
+def export_vehicles(format: str = bulk_io.FORMAT_NDJSON):
+    """Streaming export semua kendaraan (CSV / NDJSON) dari server-side cursor"""
+    if format not in bulk_io.MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail=f"Unknown format: {format}")
+    columns = [getattr(models.Vehicle, f) for f in bulk_io.VEHICLE_FIELDS]
+    query = select(*columns).order_by(models.Vehicle.id)
+    return StreamingResponse(
+        bulk_io.stream_rows(query, bulk_io.VEHICLE_FIELDS, format),
+        media_type=bulk_io.MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="vehicles.{format}"'},
+    )
+
+@app.post("/vehicles/bulk")
+async def bulk_import_vehicles(request: Request, format: Optional[str] = None):
+    """Bulk import kendaraan dari body CSV (dengan header) atau NDJSON.
+
+    Body dibaca per baris, divalidasi dan di-insert per chunk dengan satu
+    statement INSERT multi-row. Row yang gagal dilaporkan per nomor baris.
+    """
+    fmt = bulk_io.detect_format(format, request.headers.get("content-type"))
+    if fmt not in bulk_io.MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail=f"Unknown format: {fmt}")
+
+    parser = bulk_io.LineParser(fmt)
+    seen_device_ids = set()
+    received = inserted = 0
+    errors = []
+    chunk = []
+
+    async def flush_chunk():
+        nonlocal inserted
+        chunk_inserted, chunk_errors = await run_in_threadpool(
+            bulk_io.import_vehicle_chunk, chunk, seen_device_ids
+        )
+        inserted += chunk_inserted
+        errors.extend(chunk_errors)
+        chunk.clear()
+
+    async for line in bulk_io.iter_lines(request.stream()):
+        parsed = parser.parse(line)
+        if parsed is None:
+            continue
+        received += 1
+        chunk.append(parsed)
+        if len(chunk) >= bulk_io.IMPORT_CHUNK_SIZE:
+            await flush_chunk()
+    parsed = parser.finish()
+    if parsed is not None:
+        received += 1
+        chunk.append(parsed)
+    if chunk:
+        await flush_chunk()
+
+    if inserted:
+        response_cache.invalidate(("vehicles",), keys=[VEHICLE_LIST_KEY])
+    print(f"[BULK] ✅ Imported {inserted}/{received} vehicles ({len(errors)} errors)")
+
+    return {
+        "received": received,
+        "inserted": inserted,
+        "failed": len(errors),
+        "errors": sorted(errors, key=lambda e: e["line"]),
+    }
 
 @app.get("/vehicles/{vehicle_id}", response_model=schemas.VehicleResponse)
 def get_vehicle(vehicle_id: int, db: Session = Depends(get_db)):
-    vehicle = db.query(models.Vehicle).filter(models.Vehicle.id == vehicle_id).first()
-    if not vehicle:
-        raise HTTPException(status_code=404, detail="Vehicle not found")
-    return vehicle
+    def load():
+        vehicle = db.query(models.Vehicle).filter(models.Vehicle.id == vehicle_id).first()
+        if not vehicle:
+            raise HTTPException(status_code=404, detail="Vehicle not found")
+        return schemas.VehicleResponse.model_validate(vehicle)
+
+    return response_cache.get_or_load(vehicle_key(vehicle_id), ("vehicles",), load)
 
 @app.post("/vehicles", response_model=schemas.VehicleResponse)
 def create_vehicle(vehicle: schemas.VehicleCreate, db: Session = Depends(get_db)):
@@ -300,6 +575,7 @@ def create_vehicle(vehicle: schemas.VehicleCreate, db: Session = Depends(get_db)
     db.add(new_vehicle)
     db.commit()
     db.refresh(new_vehicle)
+    response_cache.invalidate(("vehicles",), keys=[VEHICLE_LIST_KEY])
     return new_vehicle
 
 @app.put("/vehicles/{vehicle_id}", response_model=schemas.VehicleResponse)
@@ -311,6 +587,7 @@ def update_vehicle(vehicle_id: int, updated: schemas.VehicleUpdate, db: Session
         setattr(vehicle, field, value)
     db.commit()
     db.refresh(vehicle)
+    response_cache.invalidate(("vehicles",), keys=[VEHICLE_LIST_KEY, vehicle_key(vehicle_id), MAP_KEY])
     return vehicle
 
 @app.delete("/vehicles/{vehicle_id}")
@@ -346,20 +623,35 @@ def delete_vehicle(vehicle_id: int, db: Session = Depends(get_db)):
             deleted_alerts = db.query(models.Alert).filter(models.Alert.device_id == vehicle.device_id).delete(synchronize_session=False)
             print(f"[DELETE] ✅ Deleted {deleted_alerts} alert records")
         
+        # Delete telemetry history (append-only, FK ke vehicles.device_id)
+        history_count = db.query(models.TelemetryHistory).filter(models.TelemetryHistory.device_id == vehicle.device_id).delete(synchronize_session=False)
+        if history_count:
+            print(f"[DELETE] ✅ Deleted {history_count} telemetry history records")
+        
+        # Delete driving rules khusus kendaraan ini
+        deleted_rules = db.query(models.DrivingRule).filter(models.DrivingRule.device_id == vehicle.device_id).delete(synchronize_session=False)
+        if deleted_rules:
+            print(f"[DELETE] ✅ Deleted {deleted_rules} driving rules")
+        
         # Step 4: Now delete the vehicle (safe because no more related data)
         db.delete(vehicle)
         
         # Step 5: Commit all changes
         db.commit()
+        response_cache.invalidate(
+            ("vehicles", "payload", "alerts", "rules"),
+            keys=[VEHICLE_LIST_KEY, vehicle_key(vehicle_id), MAP_KEY, ALERT_STATS_KEY],
+        )
         
         print(f"[DELETE] ✅ Vehicle {vehicle_id} and all related data deleted successfully")
-        print(f"[DELETE] 📊 Summary: Vehicle + {payload_count} payloads + {alert_count} alerts deleted")
+        print(f"[DELETE] 📊 Summary: Vehicle + {payload_count} payloads + {alert_count} alerts + {history_count} history rows deleted")
         
         return {
             "detail": "Vehicle and all related data deleted successfully",
             "deleted_vehicle": vehicle.vehicle_name,
             "deleted_payload_count": payload_count,
-            "deleted_alert_count": alert_count
+            "deleted_alert_count": alert_count,
+            "deleted_history_count": history_count
         }
         
     except Exception as e:
@@ -371,9 +663,37 @@ def delete_vehicle(vehicle_id: int, db: Session = Depends(get_db)):
 # ALERT ENDPOINTS
 # ============================
 
+ALERT_FIELDS = (
+    "id", "deviceId", "vehicleName", "numberPlate", "alertType", "severity",
+    "message", "lat", "lon", "isActive", "createdAt", "sensorData",
+)
+
 @app.get("/alerts")
-def get_alerts(active_only: bool = False, db: Session = Depends(get_db)):
-    """Get alerts, optionally filter active only"""
+def get_alerts(request: Request, active_only: bool = False, format: str = fast_response.FORMAT_JSON,
+               db: Session = Depends(get_db)):
+    """Get alerts, optionally filter active only.
+
+    format=fast / format=columnar mengaktifkan fast path (encoder cepat,
+    kompresi gzip/br, ETag + If-None-Match -> 304 tanpa query).
+    """
+    if format not in fast_response.FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unknown format: {format}")
+    if format == fast_response.FORMAT_JSON:
+        return build_alert_rows(db, active_only)
+
+    # ETag diambil sebelum query, jadi write yang terjadi di tengah query
+    # hanya membuat poll berikutnya menerima 200 lagi, tidak pernah 304 basi
+    etag = data_versions.etag("alerts", "vehicles", suffix=f"{format}-{int(active_only)}")
+    cached = fast_response.not_modified(request, etag)
+    if cached is not None:
+        return cached
+
+    rows = build_alert_rows(db, active_only)
+    if format == fast_response.FORMAT_COLUMNAR:
+        rows = fast_response.to_columnar(rows, ALERT_FIELDS)
+    return fast_response.encoded_response(request, rows, etag)
+
+def build_alert_rows(db: Session, active_only: bool):
     query = db.query(models.Alert)
     
     if active_only:
@@ -411,28 +731,58 @@ def resolve_alert(alert_id: int, db: Session = Depends(get_db)):
     alert.is_active = False
     alert.resolved_at = datetime.utcnow()
     db.commit()
+    response_cache.invalidate(("alerts",), keys=[ALERT_STATS_KEY])
     
     return {"detail": "Alert resolved successfully"}
 
 @app.get("/alerts/stats")
 def get_alert_stats(db: Session = Depends(get_db)):
     """Get alert statistics"""
-    total_alerts = db.query(models.Alert).count()
-    active_alerts = db.query(models.Alert).filter(models.Alert.is_active == True).count()
-    accident_alerts = db.query(models.Alert).filter(models.Alert.alert_type == "accident").count()
-    
-    return {
-        "totalAlerts": total_alerts,
-        "activeAlerts": active_alerts,
-        "accidentAlerts": accident_alerts
-    }
+    def load():
+        total_alerts = db.query(models.Alert).count()
+        active_alerts = db.query(models.Alert).filter(models.Alert.is_active == True).count()
+        accident_alerts = db.query(models.Alert).filter(models.Alert.alert_type == "accident").count()
+        
+        return {
+            "totalAlerts": total_alerts,
+            "activeAlerts": active_alerts,
+            "accidentAlerts": accident_alerts
+        }
+
+    return response_cache.get_or_load(ALERT_STATS_KEY, ("alerts",), load)
 
 # ============================
 # MAP / DASHBOARD ENDPOINT
 # ============================
 
+MAP_FIELDS = ("id", "deviceId", "name", "numberPlate", "speed", "lat", "lon")
+
 @app.get("/dashboard/map")
-def get_vehicle_locations(db: Session = Depends(get_db)):
+def get_vehicle_locations(request: Request, format: str = fast_response.FORMAT_JSON,
+                          db: Session = Depends(get_db)):
+    """Lokasi terakhir setiap kendaraan.
+
+    format=fast / format=columnar mengaktifkan fast path (lihat /alerts).
+    """
+    if format not in fast_response.FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unknown format: {format}")
+    if format == fast_response.FORMAT_JSON:
+        return cached_map_rows(db)
+
+    etag = data_versions.etag("vehicles", "payload", suffix=format)
+    cached = fast_response.not_modified(request, etag)
+    if cached is not None:
+        return cached
+
+    rows = cached_map_rows(db)
+    if format == fast_response.FORMAT_COLUMNAR:
+        rows = fast_response.to_columnar(rows, MAP_FIELDS)
+    return fast_response.encoded_response(request, rows, etag)
+
+def cached_map_rows(db: Session):
+    return response_cache.get_or_load(MAP_KEY, ("vehicles", "payload"), lambda: build_map_rows(db))
+
+def build_map_rows(db: Session):
     vehicles = db.query(models.Vehicle).all()
     response = []
 
@@ -455,4 +805,188 @@ def get_vehicle_locations(db: Session = Depends(get_db)):
                 "lon": latest_payload.lon
             })
 
-    return response
\ No newline at end of file
+    return response
+
+# ============================
+# DRIVING RULE ENDPOINTS
+# ============================
+
+RULE_CONFLICT = "Rule for this device and rule_type already exists"
+
+def validate_rule(rule: schemas.DrivingRuleCreate, db: Session, rule_id: Optional[int] = None):
+    """Validasi rule; rule_id diisi saat update supaya rule itu sendiri tidak dianggap duplikat"""
+    if rule.rule_type not in RULE_TYPES:
+        raise HTTPException(status_code=400, detail=f"Unknown rule_type: {rule.rule_type}")
+    if rule.severity not in SEVERITIES:
+        raise HTTPException(status_code=400, detail=f"Unknown severity: {rule.severity}")
+    if not rule.threshold > 0:
+        raise HTTPException(status_code=400, detail="threshold must be greater than 0")
+    if rule.device_id is not None:
+        vehicle = db.query(models.Vehicle).filter(models.Vehicle.device_id == rule.device_id).first()
+        if not vehicle:
+            raise HTTPException(status_code=404, detail="Vehicle not found")
+
+    # Satu rule per (device, rule_type); device_id NULL (rule default) dicek di sini
+    # karena unique constraint database tidak membandingkan NULL
+    duplicate = db.query(models.DrivingRule).filter(
+        models.DrivingRule.device_id.is_(None) if rule.device_id is None
+        else models.DrivingRule.device_id == rule.device_id,
+        models.DrivingRule.rule_type == rule.rule_type,
+    )
+    if rule_id is not None:
+        duplicate = duplicate.filter(models.DrivingRule.id != rule_id)
+    if duplicate.first():
+        raise HTTPException(status_code=409, detail=RULE_CONFLICT)
+
+def commit_rule(db: Session):
+    """Commit perubahan rule, 409 kalau kalah race dengan request lain"""
+    try:
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        raise HTTPException(status_code=409, detail=RULE_CONFLICT)
+
+@app.get("/rules", response_model=List[schemas.DrivingRuleResponse])
+def get_rules(device_id: Optional[str] = None, db: Session = Depends(get_db)):
+    """Driving rules; device_id kosong = rule default untuk semua kendaraan"""
+    query = db.query(models.DrivingRule)
+    if device_id:
+        query = query.filter(models.DrivingRule.device_id == device_id)
+    return query.all()
+
+@app.post("/rules", response_model=schemas.DrivingRuleResponse)
+def create_rule(rule: schemas.DrivingRuleCreate, db: Session = Depends(get_db)):
+    validate_rule(rule, db)
+    new_rule = models.DrivingRule(**rule.dict())
+    db.add(new_rule)
+    commit_rule(db)
+    db.refresh(new_rule)
+    response_cache.invalidate(("rules",))
+    return new_rule
+
+@app.put("/rules/{rule_id}", response_model=schemas.DrivingRuleResponse)
+def update_rule(rule_id: int, updated: schemas.DrivingRuleCreate, db: Session = Depends(get_db)):
+    rule = db.query(models.DrivingRule).filter(models.DrivingRule.id == rule_id).first()
+    if not rule:
+        raise HTTPException(status_code=404, detail="Rule not found")
+    validate_rule(updated, db, rule_id)
+    for field, value in updated.dict().items():
+        setattr(rule, field, value)
+    commit_rule(db)
+    db.refresh(rule)
+    response_cache.invalidate(("rules",))
+    return rule
+
+@app.delete("/rules/{rule_id}")
+def delete_rule(rule_id: int, db: Session = Depends(get_db)):
+    rule = db.query(models.DrivingRule).filter(models.DrivingRule.id == rule_id).first()
+    if not rule:
+        raise HTTPException(status_code=404, detail="Rule not found")
+    db.delete(rule)
+    db.commit()
+    response_cache.invalidate(("rules",))
+    return {"detail": "Rule deleted successfully"}
+
+# ============================
+# TELEMETRY EXPORT ENDPOINT
+# ============================
+
+@app.get("/telemetry/export")
+def export_telemetry(format: str = bulk_io.FORMAT_NDJSON, device_id: Optional[str] = None,
+                     since: Optional[datetime] = None, until: Optional[datetime] = None):
+    """Streaming export semua sample dari telemetry_history.
+
+    since / until memfilter waktu terima (received_at). Row di-stream
+    per batch lewat server-side cursor, jadi memori tetap datar.
+    """
+    if format not in bulk_io.MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail=f"Unknown format: {format}")
+    history = models.TelemetryHistory
+    columns = [getattr(history, f) for f in bulk_io.TELEMETRY_FIELDS]
+    query = select(*columns)
+    if device_id:
+        query = query.where(history.device_id == device_id)
+    if since:
+        query = query.where(history.received_at >= since)
+    if until:
+        query = query.where(history.received_at < until)
+    query = query.order_by(history.id)
+    return StreamingResponse(
+        bulk_io.stream_rows(query, bulk_io.TELEMETRY_FIELDS, format),
+        media_type=bulk_io.MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="telemetry.{format}"'},
+    )
+
+# ============================
+# ML STATUS ENDPOINT
+# ============================
+
+@app.get("/ml/status")
+def get_model_status():
+    """Status crash model: versi aktif, waktu load/warm-up dan memori (RSS/PSS) worker ini"""
+    return model_registry.status()
+
+@app.get("/ml/models")
+def get_model_versions():
+    status = model_registry.status()
+    return {"activeVersion": status["activeVersion"], "available": status["available"]}
+
+@app.post("/ml/models/{version}/activate")
+def activate_model(version: str):
+    """Hot swap model aktif tanpa restart (MQTT dan state in-memory tetap jalan)"""
+    try:
+        previous = model_registry.activate(version)
+    except ModelNotFound:
+        raise HTTPException(status_code=404, detail="Model version not found")
+    except ModelLoadError as e:
+        raise HTTPException(status_code=500, detail=f"Error loading model: {str(e)}")
+    return {"detail": "Model activated", "activeVersion": version, "previousVersion": previous}
+
+@app.post("/ml/models/{version}/shadow")
+def start_shadow_model(version: str):
+    """Jalankan model candidate dalam shadow mode, tanpa mempengaruhi alert"""
+    try:
+        model_registry.start_shadow(version)
+    except ModelNotFound:
+        raise HTTPException(status_code=404, detail="Model version not found")
+    except ModelLoadError as e:
+        raise HTTPException(status_code=500, detail=f"Error loading model: {str(e)}")
+    return {"detail": "Shadow scoring started", "candidateVersion": version}
+
+@app.get("/ml/shadow")
+def get_shadow_stats():
+    """Statistik agreement dan latency antara model aktif dan candidate (semua worker)"""
+    stats = model_registry.shadow_stats()
+    if stats is None:
+        raise HTTPException(status_code=404, detail="No shadow model running")
+    return stats
+
+@app.delete("/ml/shadow")
+def stop_shadow_model():
+    final_stats = model_registry.stop_shadow()
+    if final_stats is None:
+        raise HTTPException(status_code=404, detail="No shadow model running")
+    return {"detail": "Shadow scoring stopped", "finalStats": final_stats}
+
+# ============================
+# INGEST ENDPOINTS
+# ============================
+
+@app.get("/ingest/stats")
+def get_ingest_stats():
+    """Counter lane high/normal: backlog, coalesced dan shed"""
+    return ingest_scheduler.stats()
+
+@app.get("/ingest/spool")
+def get_spool_stats():
+    """Ukuran spool, jumlah record pending, replay rate dan lag"""
+    return ingest_sink.stats()
+
+# ============================
+# CACHE ENDPOINT
+# ============================
+
+@app.get("/cache/stats")
+def get_cache_stats():
+    """Hit/miss rate, eviction dan invalidation response cache"""
+    return response_cache.stats()
\ No newline at end of file
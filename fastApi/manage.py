@@ -0,0 +1,71 @@
+# manage.py - Command administrasi yang tidak dijalankan saat import main.py
+#
+#   python manage.py init-db        buat tabel database
+#   python manage.py export-model   buat bundle mmap dari crashmodel.pkl
+#   python manage.py replay         re-score histori dengan crash model
+#   python manage.py prune-history  hapus telemetry_history yang lebih tua dari N hari
+import argparse
+from datetime import datetime, timedelta
+
+import replay_tool
+
+
+def init_db(args):
+    from database import engine
+    import models
+
+    models.Base.metadata.create_all(bind=engine)
+    print("[DB] ✅ Schema created")
+
+
+def export_model(args):
+    import model_loader
+
+    model_loader.export_mmap_bundle(args.model)
+
+
+def replay(args):
+    replay_tool.run(args)
+
+
+def prune_history(args):
+    from sqlalchemy import delete
+    from database import SessionLocal
+    import models
+
+    cutoff = datetime.utcnow() - timedelta(days=args.days)
+    db = SessionLocal()
+    try:
+        result = db.execute(
+            delete(models.TelemetryHistory).where(models.TelemetryHistory.received_at < cutoff)
+        )
+        db.commit()
+    finally:
+        db.close()
+    print(f"[DB] ✅ Pruned {result.rowcount} telemetry history rows older than {cutoff:%Y-%m-%d}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Project monitoring admin commands")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    sub.add_parser("init-db", help="Create database tables").set_defaults(func=init_db)
+
+    export = sub.add_parser("export-model", help="Export crash model as mmap bundle")
+    export.add_argument("--model", default="crashmodel.pkl")
+    export.set_defaults(func=export_model)
+
+    replay_parser = sub.add_parser("replay", help="Re-score history with a crash model")
+    replay_tool.add_arguments(replay_parser)
+    replay_parser.set_defaults(func=replay)
+
+    prune = sub.add_parser("prune-history", help="Delete old telemetry history rows")
+    prune.add_argument("--days", type=int, default=180)
+    prune.set_defaults(func=prune_history)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
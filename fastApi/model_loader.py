@@ -0,0 +1,178 @@
+# model_loader.py - Loading crash model secara lazy + memory-mapped
+import json
+import os
+import threading
+import time
+
+import joblib
+import numpy as np
+
+from runtime_paths import app_path
+
+MODEL_PATH = app_path("crashmodel.pkl")
+MMAP_SUFFIX = ".mmap.joblib"
+# Ukuran + mtime model sumber saat bundle dibuat, disimpan di samping bundle
+SOURCE_SUFFIX = ".source.json"
+
+
+def current_memory_kb():
+    """RSS dan PSS proses ini dalam KB (PSS membagi halaman shared antar worker)"""
+    usage = {"rss_kb": None, "pss_kb": None}
+    try:
+        with open("/proc/self/smaps_rollup") as f:
+            for line in f:
+                if line.startswith("Rss:"):
+                    usage["rss_kb"] = int(line.split()[1])
+                elif line.startswith("Pss:"):
+                    usage["pss_kb"] = int(line.split()[1])
+    except OSError:
+        try:
+            import resource
+            usage["rss_kb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        except ImportError:  # Windows
+            pass
+    return usage
+
+
+def mmap_bundle_path(model_path):
+    root, _ = os.path.splitext(model_path)
+    return root + MMAP_SUFFIX
+
+
+def _source_signature(model_path):
+    stat = os.stat(model_path)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def _read_source_signature(bundle_path):
+    try:
+        with open(bundle_path + SOURCE_SUFFIX) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def bundle_is_current(model_path, bundle_path=None):
+    """True kalau bundle dibuat dari file model yang sekarang.
+
+    Dibandingkan dengan ukuran + mtime yang dicatat saat export, bukan
+    "bundle lebih baru dari model": model pengganti dengan mtime lebih lama
+    (cp -p, git checkout, rsync -t) tetap terdeteksi.
+    """
+    bundle_path = bundle_path or mmap_bundle_path(model_path)
+    if not os.path.exists(bundle_path):
+        return False
+    return _read_source_signature(bundle_path) == _source_signature(model_path)
+
+
+def export_mmap_bundle(model_path=MODEL_PATH, bundle_path=None):
+    """Dump ulang model tanpa kompresi supaya array-nya bisa di-mmap.
+
+    Ditulis ke file sementara lalu os.replace, jadi aman kalau beberapa
+    worker melakukan export bersamaan. Signature sumber ditulis terakhir,
+    jadi export yang terputus selalu diulang.
+    """
+    bundle_path = bundle_path or mmap_bundle_path(model_path)
+    signature = _source_signature(model_path)
+    model = joblib.load(model_path)
+    tmp_path = f"{bundle_path}.{os.getpid()}.tmp"
+    joblib.dump(model, tmp_path, compress=0)
+    os.replace(tmp_path, bundle_path)
+    with open(tmp_path, "w") as f:
+        json.dump(signature, f)
+    os.replace(tmp_path, bundle_path + SOURCE_SUFFIX)
+    print(f"[ML] Exported mmap bundle {bundle_path}")
+    return bundle_path
+
+
+def load_model(model_path=MODEL_PATH):
+    """Load model dengan mmap_mode='r'.
+
+    Array training set KNN dibaca langsung dari page cache, sehingga semua
+    worker uvicorn berbagi satu salinan fisik.
+    """
+    bundle_path = mmap_bundle_path(model_path)
+    if not bundle_is_current(model_path, bundle_path):
+        if os.path.exists(bundle_path):
+            print(f"[ML] ⚠️ {model_path} changed since last export, rebuilding mmap bundle")
+        export_mmap_bundle(model_path, bundle_path)
+    return joblib.load(bundle_path, mmap_mode="r")
+
+
+def warm_up(model):
+    """Satu prediksi dummy supaya halaman mmap dan struktur internal sudah siap"""
+    n_features = getattr(model, "n_features_in_", 6)
+    sample = np.zeros((1, n_features))
+    model.predict(sample)
+    if hasattr(model, "predict_proba"):
+        model.predict_proba(sample)
+
+
+class CrashModelLoader:
+    """Load + warm-up crash model di background thread, di luar request path"""
+
+    def __init__(self, model_path=MODEL_PATH):
+        self.model_path = model_path
+        self.model = None
+        self.error = None
+        self._ready = threading.Event()
+        self._started = False
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def start(self):
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        threading.Thread(target=self._load, daemon=True).start()
+
+    def _load(self):
+        memory_before = current_memory_kb()
+        started = time.perf_counter()
+        try:
+            model = load_model(self.model_path)
+            loaded = time.perf_counter()
+            warm_up(model)
+            warmed = time.perf_counter()
+
+            self.model = model
+            self._stats = {
+                "load_seconds": round(loaded - started, 4),
+                "warmup_seconds": round(warmed - loaded, 4),
+                "memory_before": memory_before,
+                "memory_after": current_memory_kb(),
+            }
+            print(f"[ML] ✅ Crash detection model loaded successfully ({self._stats['load_seconds']}s)")
+            print(f"[ML] Model type: {type(model)}")
+            print(f"[ML] Probability support: {hasattr(model, 'predict_proba')}")
+            if hasattr(model, 'n_features_in_'):
+                print(f"[ML] Expected features: {model.n_features_in_}")
+        except Exception as e:
+            self.error = str(e)
+            print(f"[ML] ❌ Failed to load crash model: {e}")
+        finally:
+            self._ready.set()
+
+    def get(self, timeout=None):
+        """Model yang sudah siap, atau None kalau belum/ gagal load.
+
+        timeout=0 tidak menunggu (untuk request path), None menunggu sampai
+        proses load selesai (untuk worker MQTT).
+        """
+        self.start()
+        self._ready.wait(timeout)
+        return self.model
+
+    def status(self):
+        return {
+            "model_path": self.model_path,
+            "ready": self._ready.is_set() and self.model is not None,
+            "error": self.error,
+            "pid": os.getpid(),
+            **self._stats,
+            "memory_now": current_memory_kb(),
+        }
+
+
+crash_model_loader = CrashModelLoader()
@@ -0,0 +1,422 @@
+# model_registry.py - Registry crash model berversi, hot swap + shadow scoring
+import glob
+import json
+import os
+import queue
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+from crash_detection import predict_batch
+from model_loader import CrashModelLoader, crash_model_loader
+from runtime_paths import app_path, data_path
+from versions import data_versions
+
+try:
+    import fcntl
+except ImportError:  # Windows - tidak ada lock antar proses
+    fcntl = None
+
+# Model berversi disimpan sebagai models_store/<version>.pkl,
+# versi "default" selalu menunjuk ke crashmodel.pkl
+MODELS_DIR = app_path("models_store")
+DEFAULT_VERSION = "default"
+
+# Versi aktif + shadow di-share antar worker lewat file ini; perubahan
+# diumumkan lewat slot "models" di data_versions
+STATE_FILE = data_path("model_state.json")
+SHADOW_STATS_DIR = data_path("shadow_stats")
+SHADOW_STATS_INTERVAL = 5.0
+
+SHADOW_QUEUE_SIZE = 1000
+LATENCY_WINDOW = 1000
+
+SHADOW_COUNTERS = (
+    "batches", "samples", "agree", "active_only_accident",
+    "candidate_only_accident", "dropped_batches", "errors",
+)
+
+
+class ModelNotFound(Exception):
+    pass
+
+
+class ModelLoadError(Exception):
+    pass
+
+
+def _percentile(values, q):
+    if not values:
+        return None
+    return round(float(np.percentile(values, q)) * 1000, 3)
+
+
+def _ratio(a, b):
+    return round(a / b, 4) if b else None
+
+
+def aggregate_shadow_stats(session, stats_dir=SHADOW_STATS_DIR):
+    """Gabungkan statistik shadow dari semua worker untuk satu sesi"""
+    workers = []
+    for path in glob.glob(os.path.join(stats_dir, f"{glob.escape(session)}.*.json")):
+        try:
+            with open(path) as f:
+                workers.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    totals = {name: sum(w.get(name, 0) for w in workers) for name in SHADOW_COUNTERS}
+    return {
+        "session": session,
+        "workers": len(workers),
+        **totals,
+        "agreementRate": _ratio(totals["agree"], totals["samples"]),
+        # Percentile latency tidak bisa digabung, jadi ditampilkan per worker
+        "perWorker": sorted(workers, key=lambda w: w["pid"]),
+    }
+
+
+class ShadowScorer:
+    """Menilai batch fitur yang sama dengan model candidate di background.
+
+    Hasilnya hanya dicatat sebagai statistik, tidak pernah membuat alert.
+    Kalau queue penuh batch di-drop, supaya ingest tidak pernah menunggu.
+    """
+
+    def __init__(self, version, model, session, stats_dir=SHADOW_STATS_DIR):
+        self.version = version
+        self.model = model
+        self.session = session
+        self.stats_dir = stats_dir
+        self._last_persist = 0.0
+        self._queue = queue.Queue(maxsize=SHADOW_QUEUE_SIZE)
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._active_latency = deque(maxlen=LATENCY_WINDOW)
+        self._candidate_latency = deque(maxlen=LATENCY_WINDOW)
+        self.started_at = time.time()
+        self.counters = {name: 0 for name in SHADOW_COUNTERS}
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, active_version, features, active_prediction, active_latency):
+        try:
+            self._queue.put_nowait((active_version, features, active_prediction, active_latency))
+        except queue.Full:
+            with self._lock:
+                self.counters["dropped_batches"] += 1
+
+    def stop(self):
+        self._stop.set()
+
+    def stats_path(self):
+        return os.path.join(self.stats_dir, f"{self.session}.{os.getpid()}.json")
+
+    def persist(self):
+        """Tulis statistik worker ini supaya bisa digabung oleh worker manapun"""
+        os.makedirs(self.stats_dir, exist_ok=True)
+        tmp_path = f"{self.stats_path()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"pid": os.getpid(), **self.stats()}, f)
+        os.replace(tmp_path, self.stats_path())
+        self._last_persist = time.monotonic()
+
+    def _run(self):
+        while not self._stop.is_set():
+            if time.monotonic() - self._last_persist >= SHADOW_STATS_INTERVAL:
+                try:
+                    self.persist()
+                except OSError as e:
+                    print(f"[ML] ❌ Failed to write shadow stats: {e}")
+            try:
+                active_version, features, active_prediction, active_latency = self._queue.get(timeout=1)
+            except queue.Empty:
+                continue
+            try:
+                started = time.perf_counter()
+                candidate_prediction, _ = predict_batch(self.model, features)
+                latency = time.perf_counter() - started
+            except Exception as e:
+                print(f"[ML] ❌ Shadow model {self.version} error: {e}")
+                with self._lock:
+                    self.counters["errors"] += 1
+                continue
+
+            active_prediction = np.asarray(active_prediction, dtype=bool)
+            with self._lock:
+                self.counters["batches"] += 1
+                self.counters["samples"] += len(active_prediction)
+                self.counters["agree"] += int(np.sum(active_prediction == candidate_prediction))
+                self.counters["active_only_accident"] += int(np.sum(active_prediction & ~candidate_prediction))
+                self.counters["candidate_only_accident"] += int(np.sum(~active_prediction & candidate_prediction))
+                self._active_latency.append(active_latency)
+                self._candidate_latency.append(latency)
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self.counters)
+            active_latency = list(self._active_latency)
+            candidate_latency = list(self._candidate_latency)
+        samples = counters["samples"]
+        return {
+            "candidateVersion": self.version,
+            "session": self.session,
+            "startedAt": self.started_at,
+            "queued": self._queue.qsize(),
+            **counters,
+            "agreementRate": _ratio(counters["agree"], samples),
+            "activeLatencyMs": {"p50": _percentile(active_latency, 50), "p95": _percentile(active_latency, 95)},
+            "candidateLatencyMs": {"p50": _percentile(candidate_latency, 50), "p95": _percentile(candidate_latency, 95)},
+        }
+
+
+class ModelRegistry:
+    """Menyimpan model yang sudah di-load per versi dan model aktif.
+
+    Swap model aktif hanya mengganti satu referensi (version, model) di
+    bawah lock, jadi MQTT tetap jalan dan state in-memory tidak hilang.
+    Versi aktif dan shadow disimpan di STATE_FILE; worker lain melihat
+    perubahannya lewat slot "models" di data_versions (seperti
+    RuleEngine.compiled()) lalu ikut swap di background. Setelah restart
+    versi yang tersimpan langsung dipakai lagi.
+    """
+
+    def __init__(self, models_dir=MODELS_DIR, state_file=STATE_FILE, stats_dir=SHADOW_STATS_DIR):
+        self.models_dir = models_dir
+        self.state_file = state_file
+        self.stats_dir = stats_dir
+        self._lock = threading.Lock()
+        self._loaders = {DEFAULT_VERSION: crash_model_loader}
+        self._active_version = DEFAULT_VERSION
+        self.shadow = None
+        self._seen_state = None
+        self._syncing = False
+
+    def model_path(self, version):
+        if version == DEFAULT_VERSION:
+            return crash_model_loader.model_path
+        if os.path.basename(version) != version:
+            raise ModelNotFound(version)
+        path = os.path.join(self.models_dir, f"{version}.pkl")
+        if not os.path.exists(path):
+            raise ModelNotFound(version)
+        return path
+
+    def versions(self):
+        found = [DEFAULT_VERSION]
+        if os.path.isdir(self.models_dir):
+            found += sorted(
+                name[:-4] for name in os.listdir(self.models_dir) if name.endswith(".pkl")
+            )
+        return found
+
+    def _loader(self, version):
+        with self._lock:
+            loader = self._loaders.get(version)
+            if loader is None:
+                loader = CrashModelLoader(self.model_path(version))
+                self._loaders[version] = loader
+            return loader
+
+    def load(self, version):
+        """Load model (mmap + warm-up) tanpa mengubah model aktif"""
+        loader = self._loader(version)
+        model = loader.get()
+        if model is None:
+            with self._lock:
+                # Loader yang gagal dibuang supaya bisa dicoba lagi, kecuali
+                # milik versi aktif (active() selalu butuh loader-nya)
+                if (self._loaders.get(version) is loader and version != DEFAULT_VERSION
+                        and version != self._active_version):
+                    del self._loaders[version]
+            raise ModelLoadError(loader.error or f"Model {version} failed to load")
+        return model
+
+    # ----- state bersama -----
+
+    def read_state(self):
+        try:
+            with open(self.state_file) as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            state = {}
+        return {
+            "active": state.get("active") or DEFAULT_VERSION,
+            "shadow": state.get("shadow"),
+            "shadowSession": state.get("shadowSession"),
+        }
+
+    def _write_state(self, **changes):
+        # Read-modify-write di bawah flock supaya dua worker tidak saling timpa
+        with open(self.state_file + ".lock", "w") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            state = self.read_state()
+            state.update(changes)
+            tmp_path = f"{self.state_file}.{os.getpid()}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(state, f)
+            os.replace(tmp_path, self.state_file)
+        data_versions.bump("models")
+        return state
+
+    def sync(self):
+        """Ikuti state bersama kalau worker lain mengubahnya.
+
+        Murah di jalur scoring: hanya membaca satu slot mmap. Kalau versi
+        berubah, load model baru dilakukan di background; sampai siap, model
+        lama tetap dipakai.
+        """
+        seen = data_versions.get("models")
+        if seen == self._seen_state:
+            return
+        with self._lock:
+            if seen == self._seen_state or self._syncing:
+                return
+            self._syncing = True
+        threading.Thread(target=self._apply_state, args=(seen,), daemon=True).start()
+
+    def _apply_state(self, seen):
+        try:
+            state = self.read_state()
+            if state["active"] != self._active_version:
+                try:
+                    self._swap(state["active"])
+                except (ModelNotFound, ModelLoadError) as e:
+                    print(f"[ML] ❌ Cannot follow active model {state['active']}: {e}")
+            shadow = self.shadow
+            if state["shadow"] is None:
+                if shadow is not None:
+                    self._stop_local_shadow()
+            elif shadow is None or shadow.session != state["shadowSession"]:
+                try:
+                    self._start_local_shadow(state["shadow"], state["shadowSession"])
+                except (ModelNotFound, ModelLoadError) as e:
+                    print(f"[ML] ❌ Cannot follow shadow model {state['shadow']}: {e}")
+            with self._lock:
+                self._seen_state = seen
+        finally:
+            with self._lock:
+                self._syncing = False
+
+    # ----- model aktif -----
+
+    def warm_up(self):
+        """Load versi aktif tersimpan di background (dipanggil saat startup).
+
+        Kalau model tersimpan ternyata gagal di-load, active() kembali ke
+        DEFAULT_VERSION.
+        """
+        self._seen_state = data_versions.get("models")
+        state = self.read_state()
+        try:
+            loader = self._loader(state["active"])
+            with self._lock:
+                self._active_version = state["active"]
+        except ModelNotFound:
+            print(f"[ML] ❌ Saved active model {state['active']} not found, using {DEFAULT_VERSION}")
+            loader = crash_model_loader
+        loader.start()
+        if state["shadow"] is not None:
+            threading.Thread(target=self._apply_state, args=(self._seen_state,), daemon=True).start()
+
+    def active(self, timeout=None):
+        """Pasangan (version, model) yang konsisten untuk satu kali scoring"""
+        self.sync()
+        with self._lock:
+            version = self._active_version
+            loader = self._loaders[version]
+        model = loader.get(timeout)
+        if model is None and loader.error is not None and version != DEFAULT_VERSION:
+            # Versi aktif gagal di-load (mis. file rusak setelah restart):
+            # worker ini kembali ke model default daripada scoring tanpa model
+            with self._lock:
+                if self._active_version == version:
+                    self._active_version = DEFAULT_VERSION
+                    print(f"[ML] ❌ Active model {version} failed to load ({loader.error}), "
+                          f"falling back to {DEFAULT_VERSION}")
+            return DEFAULT_VERSION, self._loaders[DEFAULT_VERSION].get(timeout)
+        return version, model
+
+    def _swap(self, version):
+        self.load(version)
+        with self._lock:
+            previous = self._active_version
+            self._active_version = version
+        print(f"[ML] 🔁 Active crash model switched {previous} -> {version}")
+        return previous
+
+    def activate(self, version):
+        """Swap model aktif di worker ini dan umumkan ke worker lain"""
+        previous = self._swap(version)
+        self._write_state(active=version)
+        return previous
+
+    # ----- shadow -----
+
+    def _start_local_shadow(self, version, session):
+        model = self.load(version)
+        with self._lock:
+            previous = self.shadow
+            self.shadow = ShadowScorer(version, model, session, self.stats_dir)
+        if previous is not None:
+            previous.stop()
+        print(f"[ML] 👥 Shadow scoring started for {version}")
+
+    def _stop_local_shadow(self):
+        with self._lock:
+            previous = self.shadow
+            self.shadow = None
+        if previous is not None:
+            previous.stop()
+            previous.persist()
+        return previous
+
+    def start_shadow(self, version):
+        session = f"{version}-{int(time.time())}"
+        self._start_local_shadow(version, session)
+        self._write_state(shadow=version, shadowSession=session)
+        return session
+
+    def stop_shadow(self):
+        """Hentikan shadow di semua worker, return statistik gabungan (atau None)"""
+        state = self.read_state()
+        self._stop_local_shadow()
+        if state["shadow"] is None:
+            return None
+        self._write_state(shadow=None, shadowSession=None)
+        return self.shadow_stats(state["shadowSession"])
+
+    def shadow_stats(self, session=None):
+        """Statistik shadow gabungan semua worker (None kalau tidak ada shadow)"""
+        if session is None:
+            session = self.read_state()["shadowSession"]
+        if session is None:
+            return None
+        shadow = self.shadow
+        if shadow is not None and shadow.session == session:
+            shadow.persist()
+        return aggregate_shadow_stats(session, self.stats_dir)
+
+    def record(self, active_version, features, active_prediction, active_latency):
+        """Teruskan batch yang baru dinilai model aktif ke shadow scorer (kalau ada)"""
+        shadow = self.shadow
+        if shadow is not None and shadow.version != active_version:
+            shadow.submit(active_version, features, active_prediction, active_latency)
+
+    def status(self):
+        with self._lock:
+            active_version = self._active_version
+            loaders = dict(self._loaders)
+        state = self.read_state()
+        return {
+            "activeVersion": active_version,
+            "sharedActiveVersion": state["active"],
+            "available": self.versions(),
+            "loaded": {version: loader.status() for version, loader in loaders.items()},
+            "shadow": self.shadow_stats(state["shadowSession"]),
+        }
+
+
+model_registry = ModelRegistry()
@@ -1,6 +1,6 @@
 # models.py - Updated dengan Alert model
 from sqlalchemy.orm import relationship
-from sqlalchemy import Column, Integer, String, Float, Boolean, ForeignKey, DateTime
+from sqlalchemy import Column, Integer, String, Float, Boolean, ForeignKey, DateTime, Index, UniqueConstraint
 from database import Base
 from datetime import datetime
 
@@ -49,12 +49,44 @@ class Payload(Base):
     vehicle = relationship("Vehicle", back_populates="payloads")
 
 
+class TelemetryHistory(Base):
+    """Append-only: setiap sample yang masuk lewat ingest.
+
+    Tabel payload hanya menyimpan sample terakhir per device; tabel ini
+    menyimpan semuanya untuk replay / validasi model.
+    """
+    __tablename__ = "telemetry_history"
+    __table_args__ = (
+        Index("ix_telemetry_history_device_received", "device_id", "received_at"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    device_id = Column(String(100), ForeignKey("vehicles.device_id"), nullable=False)
+    timestamp = Column(Integer, nullable=False)
+    count = Column(Integer)
+    lat = Column(Float)
+    lon = Column(Float)
+    speed = Column(Float)
+    ax = Column(Float)
+    ay = Column(Float)
+    az = Column(Float)
+    gx = Column(Float)
+    gy = Column(Float)
+    gz = Column(Float)
+    pitch = Column(Float)
+    roll = Column(Float)
+    moving = Column(Boolean)
+    total_g = Column(Float)
+    datetime_wib = Column(String(50), nullable=True)
+    received_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+
 class Alert(Base):
     __tablename__ = "alerts"
     
     id = Column(Integer, primary_key=True, index=True)
     device_id = Column(String(100), ForeignKey("vehicles.device_id"), nullable=False)
-    alert_type = Column(String(50), nullable=False)  # 'accident', 'speeding', 'harsh_braking'
+    alert_type = Column(String(50), nullable=False)  # 'accident', 'speeding', 'harsh_braking', 'sharp_cornering'
     severity = Column(String(20), nullable=False)    # 'low', 'medium', 'high', 'critical'
     message = Column(String(500), nullable=False)
     lat = Column(Float)
@@ -65,4 +97,19 @@ class Alert(Base):
     resolved_at = Column(DateTime, nullable=True)
     
     # Relasi ke Vehicle
-    vehicle = relationship("Vehicle", back_populates="alerts")
\ No newline at end of file
+    vehicle = relationship("Vehicle", back_populates="alerts")
+
+
+class DrivingRule(Base):
+    __tablename__ = "driving_rules"
+    __table_args__ = (
+        UniqueConstraint("device_id", "rule_type", name="uq_driving_rules_device_rule_type"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    # NULL = rule default untuk semua kendaraan, diisi = override per kendaraan
+    device_id = Column(String(100), ForeignKey("vehicles.device_id"), nullable=True)
+    rule_type = Column(String(50), nullable=False)   # 'speeding', 'harsh_braking', 'sharp_cornering'
+    threshold = Column(Float, nullable=False)        # km/h, m/s^2, deg/s
+    severity = Column(String(20), nullable=False, default="medium")
+    enabled = Column(Boolean, default=True)
\ No newline at end of file
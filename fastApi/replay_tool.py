@@ -0,0 +1,266 @@
+# replay_tool.py - Re-score histori telemetry dengan crash model secara paralel
+#
+#   python manage.py replay --model models_store/v2.pkl --workers 8
+#
+# Sumber history adalah tabel telemetry_history (append-only, diisi ingest),
+# bukan payload yang hanya menyimpan sample terakhir per device. History
+# di-stream per device dengan server-side cursor, device dibagi ke process
+# pool, lalu prediksi dibandingkan dengan alert accident yang benar-benar
+# dibuat. Hasilnya precision/recall + diff per device (JSON dan CSV).
+# Sample sebelum telemetry_history ada tidak bisa di-replay.
+import csv
+import json
+import multiprocessing
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import select, func
+
+# Sama dengan cooldown alert accident di main.py
+ALERT_COOLDOWN = timedelta(minutes=2)
+# Prediksi dianggap cocok dengan alert asli kalau selisih waktunya <= ini
+MATCH_TOLERANCE = timedelta(minutes=2)
+DEFAULT_BATCH_SIZE = 5000
+
+_worker_model = None
+_worker_batch_size = DEFAULT_BATCH_SIZE
+
+
+def add_arguments(parser):
+    parser.add_argument("--model", default="crashmodel.pkl", help="Model yang akan divalidasi")
+    parser.add_argument("--since", type=datetime.fromisoformat, help="Awal window (ISO, UTC)")
+    parser.add_argument("--until", type=datetime.fromisoformat, help="Akhir window (ISO, UTC)")
+    parser.add_argument("--workers", type=int, default=multiprocessing.cpu_count())
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--device", action="append", help="Batasi ke device tertentu (bisa diulang)")
+    parser.add_argument("--output", default="replay_report.json")
+    parser.add_argument("--diff-csv", default="replay_diffs.csv")
+
+
+def _window(query, column, since, until):
+    if since is not None:
+        query = query.where(column >= since)
+    if until is not None:
+        query = query.where(column < until)
+    return query
+
+
+def _init_worker(model_path, batch_size):
+    """Setiap proses: koneksi DB sendiri + model mmap (shared antar proses)"""
+    global _worker_model, _worker_batch_size
+    from database import engine
+    import model_loader
+
+    # Jangan pakai ulang koneksi milik parent process setelah fork
+    engine.dispose(close=False)
+    _worker_model = model_loader.load_model(model_path)
+    _worker_batch_size = batch_size
+
+
+def _predicted_events(device_id, since, until):
+    """Stream history satu device dan return waktu-waktu prediksi alert.
+
+    Row dengan feature NULL (kolom sensor nullable) tidak di-score dan
+    dihitung sebagai skipped, supaya satu row rusak tidak menggagalkan run.
+    """
+    from database import SessionLocal
+    from crash_detection import FEATURE_FIELDS, predict_batch
+    import numpy as np
+    import models
+
+    history = models.TelemetryHistory
+    columns = [history.received_at] + [getattr(history, f) for f in FEATURE_FIELDS]
+    query = _window(
+        select(*columns).where(history.device_id == device_id),
+        history.received_at, since, until,
+    ).order_by(history.received_at, history.id)
+
+    events = []
+    rows = skipped = positives = 0
+    last_event = None
+    db = SessionLocal()
+    try:
+        result = db.execute(query.execution_options(stream_results=True, yield_per=_worker_batch_size))
+        for batch in result.partitions():
+            rows += len(batch)
+            # None -> NaN dengan dtype float
+            features = np.array([row[1:] for row in batch], dtype=float)
+            valid = np.flatnonzero(~np.isnan(features).any(axis=1))
+            skipped += len(batch) - len(valid)
+            if not len(valid):
+                continue
+            is_accident, _ = predict_batch(_worker_model, features[valid])
+            positives += int(is_accident.sum())
+            # Terapkan cooldown yang sama dengan ingest supaya sebanding dengan alert asli
+            for index in valid[np.flatnonzero(is_accident)]:
+                at = batch[index][0]
+                if last_event is None or at - last_event >= ALERT_COOLDOWN:
+                    events.append(at)
+                    last_event = at
+    finally:
+        db.close()
+    return rows, skipped, positives, events
+
+
+def _actual_alerts(device_id, since, until):
+    from database import SessionLocal
+    import models
+
+    query = _window(
+        select(models.Alert.created_at).where(
+            models.Alert.device_id == device_id,
+            models.Alert.alert_type == "accident",
+        ),
+        models.Alert.created_at, since, until,
+    ).order_by(models.Alert.created_at)
+    db = SessionLocal()
+    try:
+        return [row[0] for row in db.execute(query)]
+    finally:
+        db.close()
+
+
+def match_events(predicted, actual, tolerance=MATCH_TOLERANCE):
+    """Greedy matching dua list waktu yang sudah terurut.
+
+    Return (matched, predicted_only, actual_only).
+    """
+    matched, predicted_only, actual_only = [], [], []
+    i = j = 0
+    while i < len(predicted) and j < len(actual):
+        delta = predicted[i] - actual[j]
+        if abs(delta) <= tolerance:
+            matched.append((predicted[i], actual[j]))
+            i += 1
+            j += 1
+        elif delta < timedelta(0):
+            predicted_only.append(predicted[i])
+            i += 1
+        else:
+            actual_only.append(actual[j])
+            j += 1
+    predicted_only.extend(predicted[i:])
+    actual_only.extend(actual[j:])
+    return matched, predicted_only, actual_only
+
+
+def _replay_device(task):
+    device_id, since, until = task
+    started = time.perf_counter()
+    rows, skipped, positives, predicted = _predicted_events(device_id, since, until)
+    actual = _actual_alerts(device_id, since, until)
+    matched, predicted_only, actual_only = match_events(predicted, actual)
+    return {
+        "deviceId": device_id,
+        "rows": rows,
+        "skippedRows": skipped,
+        "positiveSamples": positives,
+        "predictedAlerts": len(predicted),
+        "actualAlerts": len(actual),
+        "truePositives": len(matched),
+        "falsePositives": len(predicted_only),
+        "falseNegatives": len(actual_only),
+        "newAlerts": [t.isoformat() for t in predicted_only],
+        "missedAlerts": [t.isoformat() for t in actual_only],
+        "seconds": round(time.perf_counter() - started, 3),
+    }
+
+
+def _device_workload(args):
+    """Device dan jumlah row-nya, yang terbesar duluan supaya pool seimbang.
+
+    Device yang hanya punya alert accident di window (tanpa history) tetap
+    ikut, supaya alert-nya terhitung sebagai false negative.
+    """
+    from database import SessionLocal
+    import models
+
+    history = models.TelemetryHistory
+    history_query = _window(
+        select(history.device_id, func.count()).group_by(history.device_id),
+        history.received_at, args.since, args.until,
+    )
+    alert_query = _window(
+        select(models.Alert.device_id).where(models.Alert.alert_type == "accident").distinct(),
+        models.Alert.created_at, args.since, args.until,
+    )
+    if args.device:
+        history_query = history_query.where(history.device_id.in_(args.device))
+        alert_query = alert_query.where(models.Alert.device_id.in_(args.device))
+    db = SessionLocal()
+    try:
+        workload = {device_id: count for device_id, count in db.execute(history_query)}
+        for (device_id,) in db.execute(alert_query):
+            workload.setdefault(device_id, 0)
+    finally:
+        db.close()
+    return sorted(workload.items(), key=lambda item: item[1], reverse=True)
+
+
+def _ratio(a, b):
+    return round(a / b, 4) if b else None
+
+
+def run(args):
+    import model_loader
+
+    started = time.perf_counter()
+    # Export bundle mmap sekali di parent, worker hanya membaca
+    model_loader.load_model(args.model)
+
+    workload = _device_workload(args)
+    total_rows = sum(count for _, count in workload)
+    print(f"[REPLAY] {len(workload)} devices, {total_rows} rows, {args.workers} workers")
+
+    tasks = [(device_id, args.since, args.until) for device_id, _ in workload]
+    results = []
+    with multiprocessing.Pool(
+        args.workers, initializer=_init_worker, initargs=(args.model, args.batch_size)
+    ) as pool:
+        for result in pool.imap_unordered(_replay_device, tasks):
+            results.append(result)
+            print(
+                f"[REPLAY] {result['deviceId']}: {result['rows']} rows, "
+                f"TP={result['truePositives']} FP={result['falsePositives']} FN={result['falseNegatives']}"
+            )
+
+    results.sort(key=lambda r: r["deviceId"])
+    tp = sum(r["truePositives"] for r in results)
+    fp = sum(r["falsePositives"] for r in results)
+    fn = sum(r["falseNegatives"] for r in results)
+    elapsed = time.perf_counter() - started
+    rows = sum(r["rows"] for r in results)
+    skipped = sum(r["skippedRows"] for r in results)
+
+    report = {
+        "model": args.model,
+        "since": args.since.isoformat() if args.since else None,
+        "until": args.until.isoformat() if args.until else None,
+        "workers": args.workers,
+        "devices": len(results),
+        "rows": rows,
+        "skippedRows": skipped,
+        "seconds": round(elapsed, 3),
+        "rowsPerSecond": round(rows / elapsed, 1) if elapsed else None,
+        "truePositives": tp,
+        "falsePositives": fp,
+        "falseNegatives": fn,
+        "precision": _ratio(tp, tp + fp),
+        "recall": _ratio(tp, tp + fn),
+        "perDevice": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+
+    with open(args.diff_csv, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["device_id", "kind", "at"])
+        for r in results:
+            for at in r["newAlerts"]:
+                writer.writerow([r["deviceId"], "new_alert", at])
+            for at in r["missedAlerts"]:
+                writer.writerow([r["deviceId"], "missed_alert", at])
+
+    print(f"[REPLAY] ✅ precision={report['precision']} recall={report['recall']} "
+          f"({rows} rows, {skipped} skipped, in {elapsed:.1f}s) -> {args.output}, {args.diff_csv}")
+    return report
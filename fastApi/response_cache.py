@@ -0,0 +1,137 @@
+# response_cache.py - Read-through cache untuk endpoint baca, di-invalidate oleh write path
+import threading
+import time
+from collections import OrderedDict
+
+from versions import data_versions
+
+MAX_ENTRIES = 1024
+DEFAULT_TTL_SECONDS = 300
+
+
+class ResponseCache:
+    """Cache LRU + TTL dengan invalidation per key dari write path.
+
+    Setiap entry mencatat tabel sumbernya. Write di proses ini menghapus key
+    yang terdampak secara presisi (invalidate). Write dari worker lain
+    terdeteksi lewat data version bersama (versions.py); kalau versi sebuah
+    tabel berubah tanpa lewat proses ini, semua entry tabel itu dibuang.
+    """
+
+    def __init__(self, max_entries=MAX_ENTRIES, ttl=DEFAULT_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()   # key -> (value, tables, expires_at)
+        self._lock = threading.Lock()
+        # Versi tabel yang terakhir dilihat proses ini, diisi saat pertama dipakai
+        # (file versi tidak dibuka saat import)
+        self._known = None
+        # Naik setiap ada invalidation per tabel, untuk mendeteksi write selama load
+        self._generation = {t: 0 for t in data_versions.tables}
+        self.counters = {
+            "hits": 0,
+            "misses": 0,
+            "evictions": 0,
+            "expirations": 0,
+            "invalidations": 0,
+            "foreignFlushes": 0,
+        }
+
+    def _drop_tables(self, tables):
+        stale = [key for key, entry in self._entries.items() if set(entry[1]) & set(tables)]
+        for key in stale:
+            del self._entries[key]
+        self.counters["invalidations"] += len(stale)
+
+    def _generations(self, tables):
+        return tuple(self._generation[t] for t in tables)
+
+    def _load_known(self):
+        if self._known is None:
+            self._known = {t: data_versions.get(t) for t in data_versions.tables}
+
+    def _sync(self):
+        """Buang entry yang sumbernya diubah worker lain"""
+        self._load_known()
+        changed = []
+        for table, known in self._known.items():
+            current = data_versions.get(table)
+            if current != known:
+                changed.append(table)
+                self._known[table] = current
+                self._generation[table] += 1
+        if changed:
+            self.counters["foreignFlushes"] += 1
+            self._drop_tables(changed)
+
+    def get_or_load(self, key, tables, loader, ttl=None):
+        """Ambil dari cache, atau panggil loader() dan simpan hasilnya.
+
+        Hasil load tidak disimpan kalau tabel sumbernya di-invalidate selama
+        loader berjalan, jadi cache tidak pernah menyimpan data dari sebelum
+        sebuah write.
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._sync()
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[2] > now:
+                    self._entries.move_to_end(key)
+                    self.counters["hits"] += 1
+                    return entry[0]
+                del self._entries[key]
+                self.counters["expirations"] += 1
+            self.counters["misses"] += 1
+            generation = self._generations(tables)
+
+        value = loader()
+
+        with self._lock:
+            self._sync()
+            if self._generations(tables) == generation:
+                self._entries[key] = (value, tuple(tables), now + (ttl or self.ttl))
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+                    self.counters["evictions"] += 1
+        return value
+
+    def invalidate(self, tables, keys=()):
+        """Dipanggil write path setelah commit.
+
+        Menaikkan data version tabel (untuk ETag dan worker lain) dan
+        menghapus key yang terdampak. Kalau di antara dua write lokal ada
+        write dari worker lain, semua entry tabel tersebut ikut dibuang.
+        """
+        with self._lock:
+            self._load_known()
+            new_versions = data_versions.bump(*tables)
+            foreign = []
+            for table, version in zip(tables, new_versions):
+                if version != self._known[table] + 1:
+                    foreign.append(table)
+                self._known[table] = version
+                self._generation[table] += 1
+            if foreign:
+                self.counters["foreignFlushes"] += 1
+                self._drop_tables(foreign)
+            for key in keys:
+                if self._entries.pop(key, None) is not None:
+                    self.counters["invalidations"] += 1
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self.counters)
+            size = len(self._entries)
+        lookups = counters["hits"] + counters["misses"]
+        return {
+            **counters,
+            "size": size,
+            "maxEntries": self.max_entries,
+            "ttlSeconds": self.ttl,
+            "hitRate": round(counters["hits"] / lookups, 4) if lookups else None,
+        }
+
+
+response_cache = ResponseCache()
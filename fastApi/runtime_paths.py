@@ -0,0 +1,17 @@
+# runtime_paths.py - Lokasi file model dan file runtime, tidak bergantung working directory
+import os
+
+# Folder aplikasi (tempat crashmodel.pkl dan models_store/)
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# File runtime (data version, spool, state model) ditulis di sini.
+# Default folder aplikasi, bisa diganti lewat env TRACKER_DATA_DIR.
+DATA_DIR = os.environ.get("TRACKER_DATA_DIR") or BASE_DIR
+
+
+def app_path(name):
+    return os.path.join(BASE_DIR, name)
+
+
+def data_path(name):
+    return os.path.join(DATA_DIR, name)
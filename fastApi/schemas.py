@@ -79,4 +79,21 @@ class AlertWithVehicle(BaseModel):
     lon: Optional[float]
     isActive: bool
     createdAt: str
-    sensorData: Optional[Dict[str, Any]]
\ No newline at end of file
+    sensorData: Optional[Dict[str, Any]]
+
+# Driving Rule Schemas
+class DrivingRuleBase(BaseModel):
+    device_id: Optional[str] = None
+    rule_type: str
+    threshold: float
+    severity: str = "medium"
+    enabled: bool = True
+
+class DrivingRuleCreate(DrivingRuleBase):
+    pass
+
+class DrivingRuleResponse(DrivingRuleBase):
+    id: int
+
+    class Config:
+        from_attributes = True
\ No newline at end of file
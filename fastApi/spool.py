@@ -0,0 +1,539 @@
+# spool.py - Spool lokal (append-only, mmap) untuk ingest saat database down / lambat
+import mmap
+import os
+import struct
+import threading
+import time
+
+from runtime_paths import data_path
+
+try:
+    import fcntl
+except ImportError:  # Windows - tidak ada lock antar proses
+    fcntl = None
+
+SPOOL_PATH = data_path("ingest_spool.bin")
+INITIAL_SIZE = 16 * 1024 * 1024
+MAX_SIZE = 1024 * 1024 * 1024
+
+# Flush ke disk paling lambat setiap FLUSH_EVERY record atau FLUSH_INTERVAL detik
+FLUSH_EVERY = 32
+FLUSH_INTERVAL = 1.0
+
+# Ruang record yang sudah di-replay diambil kembali (tail dipindah ke awal
+# file) begitu mencapai ukuran ini
+COMPACT_MIN_BYTES = 1024 * 1024
+
+# Satu file spool per worker uvicorn, maksimal MAX_SLOTS worker
+MAX_SLOTS = 64
+
+REPLAY_BATCH = 500
+REPLAY_IDLE_SLEEP = 1.0
+REPLAY_RETRY_SLEEP = 5.0
+
+# Write ke DB yang lebih lama dari ini dianggap "DB lambat"
+DB_SLOW_SECONDS = 2.0
+DB_SLOW_BACKOFF = 10.0
+
+# Header: magic, write offset, read offset, jumlah record pending
+_MAGIC = b"SPL1"
+_HEADER = struct.Struct("<4sQQQ")
+# Record: panjang payload, waktu masuk spool (epoch), lalu payload bytes
+_RECORD = struct.Struct("<Id")
+
+
+class SpoolFull(Exception):
+    pass
+
+
+def _slot_paths(path):
+    """ingest_spool.bin, ingest_spool.1.bin, ... sampai MAX_SLOTS"""
+    root, ext = os.path.splitext(path)
+    return [path if slot == 0 else f"{root}.{slot}{ext}" for slot in range(MAX_SLOTS)]
+
+
+def _lock_slot(slot_path):
+    """fd file slot yang sudah di-flock, atau None kalau dipakai worker lain"""
+    fd = os.open(slot_path, os.O_RDWR | os.O_CREAT, 0o644)
+    if fcntl is None:
+        return fd
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return fd
+    except OSError:
+        os.close(fd)
+        return None
+
+
+def _open_slot(path):
+    """Buka file spool yang belum dipakai worker lain.
+
+    Setiap worker uvicorn punya MQTT client sendiri, jadi masing-masing
+    memakai file spool sendiri: ingest_spool.bin, ingest_spool.1.bin, dst.
+    Slot dikunci dengan flock. Slot yang tidak terpakai setelah restart
+    (jumlah worker berkurang) diambil alih lewat SpoolingSink.adopt_orphans.
+    """
+    for slot_path in _slot_paths(path):
+        fd = _lock_slot(slot_path)
+        if fd is not None:
+            return slot_path, fd
+    raise RuntimeError(f"No free spool slot for {path}")
+
+
+class Spool:
+    """File append-only yang di-mmap, dibaca FIFO oleh replayer.
+
+    Record yang sudah di-replay tidak dihapus satu per satu. Begitu read
+    offset menyusul write offset, kedua offset di-reset ke awal file; kalau
+    masih ada record baru (ingest terus berjalan), record yang belum dibaca
+    dipindah ke awal file setelah ruang yang sudah di-replay cukup besar.
+    """
+
+    def __init__(self, path=SPOOL_PATH, initial_size=INITIAL_SIZE, max_size=MAX_SIZE,
+                 compact_min_bytes=COMPACT_MIN_BYTES, opened=None):
+        # opened: (path, fd) slot yang sudah di-flock pemanggil
+        self.path, self._fd = opened or _open_slot(path)
+        self.max_size = max_size
+        self.compact_min_bytes = compact_min_bytes
+        self.compactions = 0
+        self._lock = threading.Lock()
+        self._unflushed = 0
+        self._last_flush = time.monotonic()
+
+        size = os.fstat(self._fd).st_size
+        if size < initial_size:
+            os.ftruncate(self._fd, initial_size)
+            size = initial_size
+        self._size = size
+        self._mm = mmap.mmap(self._fd, size)
+
+        magic, write_off, read_off, pending = _HEADER.unpack_from(self._mm, 0)
+        if magic != _MAGIC:
+            write_off = read_off = _HEADER.size
+            pending = 0
+        self._write_off = write_off
+        self._read_off = read_off
+        self._pending = pending
+        self._write_header()
+        self._mm.flush()
+
+        if pending:
+            print(f"[SPOOL] Recovered {pending} pending records from {self.path}")
+
+    def _write_header(self):
+        _HEADER.pack_into(self._mm, 0, _MAGIC, self._write_off, self._read_off, self._pending)
+
+    def _grow(self, needed):
+        new_size = self._size
+        while new_size < needed:
+            new_size *= 2
+        if new_size > self.max_size:
+            raise SpoolFull(f"spool would exceed {self.max_size} bytes")
+        self._mm.flush()
+        self._mm.close()
+        os.ftruncate(self._fd, new_size)
+        self._mm = mmap.mmap(self._fd, new_size)
+        self._size = new_size
+        print(f"[SPOOL] Grown to {new_size // 1024} KB")
+
+    def _maybe_flush(self, force=False):
+        if not self._unflushed:
+            return
+        now = time.monotonic()
+        if force or self._unflushed >= FLUSH_EVERY or now - self._last_flush >= FLUSH_INTERVAL:
+            self._mm.flush()
+            self._unflushed = 0
+            self._last_flush = now
+
+    def append(self, payload: bytes, spooled_at=None):
+        with self._lock:
+            end = self._write_off + _RECORD.size + len(payload)
+            if end > self._size:
+                self._grow(end)
+            _RECORD.pack_into(self._mm, self._write_off, len(payload),
+                              time.time() if spooled_at is None else spooled_at)
+            self._mm[self._write_off + _RECORD.size:end] = payload
+            self._write_off = end
+            self._pending += 1
+            self._write_header()
+            self._unflushed += 1
+            self._maybe_flush()
+
+    def read_batch(self, max_records=REPLAY_BATCH):
+        """Baca record tertua tanpa menghapusnya.
+
+        Return (records, cursor) dengan records list (payload, spooled_at);
+        spooled_at adalah epoch saat record masuk spool. Panggil
+        commit(cursor, len(records)) setelah record berhasil ditulis ke
+        database.
+        """
+        with self._lock:
+            records = []
+            offset = self._read_off
+            while offset < self._write_off and len(records) < max_records:
+                length, spooled_at = _RECORD.unpack_from(self._mm, offset)
+                start = offset + _RECORD.size
+                records.append((bytes(self._mm[start:start + length]), spooled_at))
+                offset = start + length
+            return records, offset
+
+    def cursor_after(self, count):
+        """Offset setelah count record pertama yang belum di-replay"""
+        with self._lock:
+            offset = self._read_off
+            for _ in range(count):
+                length, _ = _RECORD.unpack_from(self._mm, offset)
+                offset += _RECORD.size + length
+            return offset
+
+    def iter_pending(self):
+        """Semua record yang belum di-replay (dipakai saat recovery)"""
+        records, _ = self.read_batch(max_records=self._pending)
+        return records
+
+    def _maybe_compact(self):
+        """Pindahkan record yang belum dibaca ke awal file.
+
+        Hanya dilakukan kalau tail tidak overlap dengan tujuan, dan header
+        dengan read offset terbaru di-flush dulu, jadi record pending di disk
+        tetap utuh sampai header baru ditulis (aman kalau proses mati di
+        tengah jalan).
+        """
+        consumed = self._read_off - _HEADER.size
+        tail = self._write_off - self._read_off
+        if consumed < self.compact_min_bytes or tail > consumed:
+            return
+        self._write_header()
+        self._mm.flush()
+        self._mm.move(_HEADER.size, self._read_off, tail)
+        self._mm.flush()
+        self._read_off = _HEADER.size
+        self._write_off = _HEADER.size + tail
+        self.compactions += 1
+
+    def commit(self, cursor, count):
+        """Tandai record sampai cursor sudah di-replay.
+
+        Compaction hanya terjadi di sini (thread replayer), sehingga cursor
+        dari read_batch tidak pernah berubah di tengah jalan.
+        """
+        with self._lock:
+            self._read_off = cursor
+            self._pending -= count
+            if self._read_off >= self._write_off:
+                self._read_off = self._write_off = _HEADER.size
+                self._pending = 0
+            else:
+                self._maybe_compact()
+            self._write_header()
+            self._unflushed += 1
+            self._maybe_flush()
+
+    def flush(self):
+        with self._lock:
+            self._maybe_flush(force=True)
+
+    def close(self):
+        with self._lock:
+            self._maybe_flush(force=True)
+            self._mm.close()
+            os.close(self._fd)
+
+    @property
+    def pending(self):
+        return self._pending
+
+    def stats(self):
+        with self._lock:
+            oldest = None
+            if self._read_off < self._write_off:
+                _, oldest = _RECORD.unpack_from(self._mm, self._read_off)
+            return {
+                "path": self.path,
+                "fileBytes": self._size,
+                "usedBytes": self._write_off - self._read_off,
+                "pendingRecords": self._pending,
+                "compactions": self.compactions,
+                "lagSeconds": round(time.time() - oldest, 3) if oldest else 0.0,
+            }
+
+
+class SpoolingSink:
+    """Routing ingest ke database atau ke spool.
+
+    Selama DB tidak tersedia (error / lambat) semua sample baru masuk spool.
+    Setelah DB pulih, device yang masih punya record di spool tetap di-spool
+    sampai record-nya di-replay, jadi urutan per device terjaga; device lain
+    langsung kembali ke write DB tanpa menunggu spool kosong.
+
+    write_batch(samples, spooled_times) menerima epoch saat tiap sample
+    masuk spool, supaya waktu terima asli tidak hilang saat replay.
+    """
+
+    def __init__(self, write_one, write_batch, health_check, decode, path=SPOOL_PATH,
+                 poison_errors=()):
+        self.path = path
+        # Exception yang berarti record itu sendiri tidak bisa ditulis
+        # (mis. IntegrityError / DataError); error decode selalu poison
+        self.poison_errors = poison_errors
+        self.spool = None
+        self.write_one = write_one
+        self.write_batch = write_batch
+        self.health_check = health_check
+        self.decode = decode
+        self._route_lock = threading.Lock()
+        self._db_available = True
+        self._slow_until = 0.0
+        self._started = False
+        # device_id -> jumlah record device itu yang masih di spool
+        self._pending_devices = {}
+        # Device yang sedang ditulis langsung oleh salah satu thread scheduler
+        self._inflight = set()
+        self.counters = {
+            "direct": 0,
+            "spooled": 0,
+            "replayed": 0,
+            "replayBatches": 0,
+            "poisoned": 0,
+            "lost": 0,
+            "criticalSpoolFull": 0,
+            "dbErrors": 0,
+            "dbSlow": 0,
+        }
+        self.replay_rate = 0.0
+        self.last_error = None
+
+    def start(self):
+        """Buka file spool dan jalankan replayer (dipanggil saat startup)"""
+        with self._route_lock:
+            if self._started:
+                return
+            self.spool = Spool(self.path)
+            self.adopt_orphans()
+            self._db_available = self.spool.pending == 0
+            for raw, _ in self.spool.iter_pending():
+                self._track(raw, +1)
+            self._started = True
+        threading.Thread(target=self._replay_loop, daemon=True).start()
+
+    def adopt_orphans(self):
+        """Pindahkan record pending dari slot yang tidak dikunci worker manapun.
+
+        Terjadi kalau service restart dengan worker lebih sedikit: slot
+        bernomor tinggi tidak dibuka lagi. Record disalin ke spool sendiri
+        (dengan waktu spool aslinya) lalu di-commit di slot lama.
+        Return jumlah record yang diambil alih.
+        """
+        if fcntl is None:
+            return 0
+        adopted = 0
+        for slot_path in _slot_paths(self.path):
+            if slot_path == self.spool.path or not os.path.exists(slot_path):
+                continue
+            fd = _lock_slot(slot_path)
+            if fd is None:
+                continue  # dipakai worker lain
+            orphan = Spool(slot_path, opened=(slot_path, fd))
+            try:
+                records, _ = orphan.read_batch(max_records=orphan.pending)
+                copied = 0
+                try:
+                    for raw, spooled_at in records:
+                        self.spool.append(raw, spooled_at)
+                        copied += 1
+                except SpoolFull as e:
+                    print(f"[SPOOL] ⚠️ Cannot adopt all records from {slot_path}: {e}")
+                # Salinan harus ada di disk sebelum slot lama di-commit
+                self.spool.flush()
+                if copied:
+                    orphan.commit(orphan.cursor_after(copied), copied)
+                    adopted += copied
+                    print(f"[SPOOL] Adopted {copied} pending records from {slot_path}")
+            finally:
+                orphan.close()
+        return adopted
+
+    def _track(self, raw, delta, device=None):
+        """Update jumlah record pending per device (dipanggil di bawah _route_lock)"""
+        if device is None:
+            try:
+                device = self.decode(raw).device
+            except Exception:
+                return
+        count = self._pending_devices.get(device, 0) + delta
+        if count > 0:
+            self._pending_devices[device] = count
+        else:
+            self._pending_devices.pop(device, None)
+
+    def _spool(self, raw: bytes, device, critical=False):
+        """Append ke spool (dipanggil di bawah _route_lock).
+
+        Kalau spool penuh, sample biasa dihitung hilang; sample critical
+        (high priority) meneruskan SpoolFull ke pemanggil supaya di-retry.
+        """
+        try:
+            self.spool.append(raw)
+            self.counters["spooled"] += 1
+            self._track(raw, +1, device)
+        except SpoolFull as e:
+            if critical:
+                self.counters["criticalSpoolFull"] += 1
+                raise
+            self.counters["lost"] += 1
+            print(f"[SPOOL] ❌ Sample lost, {e}")
+
+    def spill(self, raw: bytes, sample):
+        """Tulis langsung ke spool (dipakai scheduler saat lane high penuh).
+
+        Raise SpoolFull kalau spool penuh, sample high priority tidak boleh
+        hilang diam-diam.
+        """
+        self.start()
+        with self._route_lock:
+            self._spool(raw, sample.device, critical=True)
+
+    def submit(self, raw: bytes, sample, db_errors, critical=False):
+        """Tulis sample ke DB, atau ke spool kalau DB tidak bisa dipakai.
+
+        raw adalah payload JSON asli (yang disimpan di spool), db_errors
+        tuple exception yang menandakan DB tidak tersedia. Dipanggil dari
+        beberapa thread scheduler sekaligus: keputusan routing dan semua
+        state dijaga _route_lock, dan satu device hanya ditulis langsung oleh
+        satu thread pada satu waktu (yang lain masuk spool di belakangnya).
+        """
+        self.start()
+        device = sample.device
+        with self._route_lock:
+            direct = (
+                self._db_available
+                and device not in self._pending_devices
+                and device not in self._inflight
+                and time.monotonic() >= self._slow_until
+            )
+            if not direct:
+                self._spool(raw, device, critical)
+                return
+            self._inflight.add(device)
+
+        started = time.monotonic()
+        try:
+            self.write_one(sample)
+        except db_errors as e:
+            with self._route_lock:
+                self._inflight.discard(device)
+                self._db_available = False
+                self.counters["dbErrors"] += 1
+                self.last_error = str(e)
+                self._spool(raw, device, critical)
+            print(f"[SPOOL] ⚠️ DB unavailable, spooling ingest: {e}")
+            return
+        except Exception:
+            with self._route_lock:
+                self._inflight.discard(device)
+            raise
+
+        elapsed = time.monotonic() - started
+        with self._route_lock:
+            self._inflight.discard(device)
+            self.counters["direct"] += 1
+            slow = elapsed > DB_SLOW_SECONDS
+            if slow:
+                self.counters["dbSlow"] += 1
+                self._slow_until = time.monotonic() + DB_SLOW_BACKOFF
+        if slow:
+            print(f"[SPOOL] ⚠️ DB slow ({elapsed:.1f}s), spooling for {DB_SLOW_BACKOFF:.0f}s")
+
+    def _replay_once(self):
+        records, cursor = self.spool.read_batch()
+        if not records:
+            return 0
+
+        # (posisi record di batch, sample, spooled_at)
+        decoded = []
+        undecodable = []
+        for index, (raw, spooled_at) in enumerate(records):
+            try:
+                decoded.append((index, self.decode(raw), spooled_at))
+            except Exception as e:
+                undecodable.append(index)
+                print(f"[SPOOL] ❌ Dropping undecodable record: {e}")
+        started = time.monotonic()
+        dropped = 0
+        try:
+            self.write_batch([d[1] for d in decoded], [d[2] for d in decoded])
+        except Exception as e:
+            if not self.health_check():
+                raise
+            # DB sehat tapi batch gagal: cari record yang bermasalah satu per satu.
+            # Hanya error yang disebabkan isi record (poison_errors) yang membuat
+            # record dibuang; error lain (deadlock, tabel belum ada, bug) membuat
+            # sisa record tetap di spool dan replay di-retry nanti.
+            print(f"[SPOOL] Batch replay failed with healthy DB, retrying per record: {e}")
+            for done, (index, sample, spooled_at) in enumerate(decoded):
+                try:
+                    self.write_batch([sample], [spooled_at])
+                except self.poison_errors as record_error:
+                    dropped += 1
+                    print(f"[SPOOL] ❌ Dropping unreplayable record: {record_error}")
+                except Exception:
+                    # Record sebelum ini sudah ditulis, jangan di-replay ulang
+                    self._commit_replayed(
+                        index, self.spool.cursor_after(index), decoded[:done],
+                        dropped + sum(1 for i in undecodable if i < index), started,
+                    )
+                    raise
+
+        self._commit_replayed(len(records), cursor, decoded, dropped + len(undecodable), started)
+        return len(records)
+
+    def _commit_replayed(self, count, cursor, decoded, poisoned, started):
+        if not count:
+            return
+        elapsed = max(time.monotonic() - started, 1e-6)
+        with self._route_lock:
+            # Commit + update pending per device atomik terhadap submit()
+            self.spool.commit(cursor, count)
+            for _, sample, _ in decoded:
+                self._track(None, -1, sample.device)
+            self.counters["poisoned"] += poisoned
+            self.counters["replayed"] += count
+            self.counters["replayBatches"] += 1
+            self.replay_rate = round(count / elapsed, 1)
+
+    def _replay_loop(self):
+        while True:
+            try:
+                self.spool.flush()
+                if self.spool.pending == 0 and self._db_available:
+                    time.sleep(REPLAY_IDLE_SLEEP)
+                    continue
+                if not self.health_check():
+                    time.sleep(REPLAY_RETRY_SLEEP)
+                    continue
+                if not self._db_available:
+                    # DB sehat lagi: device tanpa record di spool kembali ke write langsung
+                    with self._route_lock:
+                        self._db_available = True
+                    print("[SPOOL] ✅ DB healthy again, direct writes resumed")
+                if self._replay_once() == 0:
+                    time.sleep(REPLAY_IDLE_SLEEP)
+            except Exception as e:
+                with self._route_lock:
+                    self.last_error = str(e)
+                print(f"[SPOOL] ❌ Replay error: {e}")
+                time.sleep(REPLAY_RETRY_SLEEP)
+
+    def stats(self):
+        with self._route_lock:
+            counters = dict(self.counters)
+            state = {
+                "dbAvailable": self._db_available,
+                "devicesWithBacklog": len(self._pending_devices),
+                "directWritesInFlight": len(self._inflight),
+                "replayRatePerSecond": self.replay_rate,
+                "lastError": self.last_error,
+            }
+        if self.spool is None:
+            return {"started": False, **counters}
+        return {"started": True, **self.spool.stats(), **counters, **state}
@@ -0,0 +1,9 @@
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# File runtime (data version, spool, state model) ditulis ke direktori
+# sementara, bukan ke folder aplikasi
+os.environ["TRACKER_DATA_DIR"] = tempfile.mkdtemp(prefix="fastapi-tests-")
@@ -0,0 +1,79 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("sqlalchemy")
+pytest.importorskip("pydantic")
+pytest.importorskip("fastapi")
+pytest.importorskip("pymysql")
+
+from bulk_io import FORMAT_CSV, FORMAT_NDJSON, LineParser, import_vehicle_chunk, iter_lines  # noqa: E402
+
+VEHICLE = {
+    "device_id": "dev-1", "vehicle_name": "Truck", "number_plate": "B 1",
+    "driver_name": "Driver", "contact_number": "0800",
+}
+
+
+def parse_all(fmt, body):
+    async def stream():
+        # Potongan kecil supaya baris terpecah di antara chunk
+        for i in range(0, len(body), 7):
+            yield body[i:i + 7]
+
+    async def collect():
+        return [line async for line in iter_lines(stream())]
+
+    parser = LineParser(fmt)
+    rows = [parser.parse(line) for line in asyncio.run(collect())]
+    rows.append(parser.finish())
+    return [row for row in rows if row is not None]
+
+
+def test_csv_rows_with_header_and_bom():
+    body = "﻿device_id,vehicle_name\r\ndev-1,Truck\r\n\r\ndev-2,Bus".encode()
+    assert parse_all(FORMAT_CSV, body) == [
+        (2, {"device_id": "dev-1", "vehicle_name": "Truck"}),
+        (4, {"device_id": "dev-2", "vehicle_name": "Bus"}),
+    ]
+
+
+def test_csv_quoted_field_with_newline_and_column_count():
+    body = b'device_id,vehicle_name\ndev-1,"Truck\nwith ""two"" lines"\ndev-2\n'
+    assert parse_all(FORMAT_CSV, body) == [
+        (2, {"device_id": "dev-1", "vehicle_name": 'Truck\nwith "two" lines'}),
+        (4, "Expected 2 columns, got 1"),
+    ]
+
+
+def test_csv_unterminated_quote_reported():
+    rows = parse_all(FORMAT_CSV, b'device_id,vehicle_name\ndev-1,"Truck\n')
+    assert rows == [(2, "Unterminated quoted field")]
+
+
+def test_invalid_utf8_reported_per_line():
+    body = b'{"device_id": "a"}\n{"device_id": "\xff"}\n{"device_id": "c"}\n'
+    rows = parse_all(FORMAT_NDJSON, body)
+    assert rows[0] == (1, {"device_id": "a"})
+    assert rows[1][0] == 2 and rows[1][1].startswith("Invalid UTF-8")
+    assert rows[2] == (3, {"device_id": "c"})
+
+
+def test_ndjson_errors():
+    rows = parse_all(FORMAT_NDJSON, b'{"a": 1\n[1, 2]\n')
+    assert rows[0][0] == 1 and rows[0][1].startswith("Invalid JSON")
+    assert rows[1] == (2, "Expected a JSON object")
+
+
+def test_import_chunk_reports_invalid_and_duplicate_rows_without_db():
+    seen = {"dev-1"}
+    rows = [
+        (2, "Expected 6 columns, got 1"),
+        (3, {**VEHICLE, "vehicle_name": None}),
+        (4, dict(VEHICLE)),
+    ]
+    inserted, errors = import_vehicle_chunk(rows, seen)
+    assert inserted == 0
+    assert [(e["line"], e["deviceId"]) for e in errors] == [(2, None), (3, "dev-1"), (4, "dev-1")]
+    assert "vehicle_name" in errors[1]["error"]
+    assert errors[2]["error"] == "Duplicate device_id in file"
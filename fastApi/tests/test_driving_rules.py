@@ -0,0 +1,87 @@
+from types import SimpleNamespace
+
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("sqlalchemy")
+
+from driving_rules import (  # noqa: E402
+    HARSH_BRAKING, MAX_SAMPLE_GAP_SECONDS, SHARP_CORNERING, SPEEDING, CompiledRules, RuleEngine,
+)
+from versions import data_versions  # noqa: E402
+
+
+def sample(device, timestamp, speed, ay=0.0, gz=0.0):
+    return SimpleNamespace(device=device, timestamp=timestamp, speed=speed, ay=ay, gz=gz)
+
+
+def rule(rule_type, threshold, device_id=None, severity="medium", enabled=True):
+    return SimpleNamespace(rule_type=rule_type, threshold=threshold, device_id=device_id,
+                           severity=severity, enabled=enabled)
+
+
+def engine_with(*rules):
+    # Rule di-inject langsung, compiled() tidak query DB selama versinya sama
+    engine = RuleEngine()
+    engine._compiled = CompiledRules(list(rules), data_versions.get("rules"))
+    return engine
+
+
+def previous(engine, samples):
+    devices, inverse = np.unique([s.device for s in samples], return_inverse=True)
+    timestamps = np.array([s.timestamp for s in samples], dtype=float)
+    speeds = np.array([s.speed for s in samples], dtype=float)
+    return engine._previous(devices, inverse, timestamps, speeds)
+
+
+def test_previous_sample_per_device_across_batches():
+    engine = RuleEngine()
+    prev_ts, prev_speed = previous(engine, [
+        sample("a", 0, 100), sample("b", 0, 50), sample("a", 1, 90),
+    ])
+    assert np.isnan(prev_ts[0]) and np.isnan(prev_ts[1])
+    assert (prev_ts[2], prev_speed[2]) == (0, 100)
+
+    # Sample pertama tiap device di batch berikutnya memakai state batch sebelumnya
+    prev_ts, prev_speed = previous(engine, [sample("b", 1, 40), sample("a", 2, 80)])
+    assert (prev_ts[0], prev_speed[0]) == (0, 50)
+    assert (prev_ts[1], prev_speed[1]) == (1, 90)
+
+
+def test_older_sample_does_not_overwrite_state():
+    engine = RuleEngine()
+    previous(engine, [sample("a", 10, 100)])
+    previous(engine, [sample("a", 5, 20)])
+    prev_ts, prev_speed = previous(engine, [sample("a", 11, 90)])
+    assert (prev_ts[0], prev_speed[0]) == (10, 100)
+
+
+def test_harsh_braking_from_speed_drop():
+    engine = engine_with(rule(HARSH_BRAKING, 5.0))
+    # 100 -> 60 km/h dalam 1 detik = 11.1 m/s^2
+    hits = engine.evaluate([sample("a", 0, 100), sample("a", 1, 60)])
+    assert [(h.index, h.rule_type) for h in hits] == [(1, HARSH_BRAKING)]
+    assert hits[0].value == pytest.approx(40 / 3.6)
+
+
+def test_gap_and_out_of_order_samples_are_ignored():
+    engine = engine_with(rule(HARSH_BRAKING, 5.0))
+    gap = MAX_SAMPLE_GAP_SECONDS + 1
+    assert engine.evaluate([sample("a", 0, 100), sample("a", gap, 0)]) == []
+    # dt <= 0: sample lebih lama dari state tersimpan
+    assert engine.evaluate([sample("a", 0, 0)]) == []
+    # Accelerometer tetap terdeteksi tanpa sample sebelumnya
+    hits = engine.evaluate([sample("b", 0, 50, ay=-7.0)])
+    assert [(h.device_id, h.value) for h in hits] == [("b", 7.0)]
+
+
+def test_device_override_and_disabled_rule():
+    engine = engine_with(
+        rule(SPEEDING, 80.0),
+        rule(SPEEDING, 60.0, device_id="truck", severity="high"),
+        rule(SHARP_CORNERING, 30.0, enabled=False),
+    )
+    hits = engine.evaluate([
+        sample("car", 0, 70, gz=90), sample("truck", 0, 70), sample("car", 1, 85),
+    ])
+    assert [(h.index, h.device_id, h.severity) for h in hits] == [(1, "truck", "high"), (2, "car", "medium")]
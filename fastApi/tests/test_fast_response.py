@@ -0,0 +1,68 @@
+import gzip
+import json
+
+import pytest
+
+pytest.importorskip("fastapi")
+
+from starlette.requests import Request  # noqa: E402
+
+import fast_response  # noqa: E402
+from fast_response import _negotiate_encoding, encoded_response, not_modified, to_columnar  # noqa: E402
+
+
+def request(**headers):
+    return Request({
+        "type": "http",
+        "headers": [(k.replace("_", "-").encode(), v.encode()) for k, v in headers.items()],
+    })
+
+
+@pytest.mark.parametrize("header", [
+    '"e1-2"', 'W/"e1-2"', '"other", W/"e1-2"', '*',
+])
+def test_not_modified_weak_comparison(header):
+    response = not_modified(request(if_none_match=header), '"e1-2"')
+    assert response.status_code == 304
+    assert response.headers["etag"] == 'W/"e1-2"'
+
+
+@pytest.mark.parametrize("header", [None, '"e1-3"', 'W/"e1"', '"e1-2-x"'])
+def test_not_modified_mismatch(header):
+    headers = {"if_none_match": header} if header else {}
+    assert not_modified(request(**headers), '"e1-2"') is None
+
+
+def test_negotiate_encoding(monkeypatch):
+    monkeypatch.setattr(fast_response, "brotli", object())
+    assert _negotiate_encoding(request(accept_encoding="gzip, br")) == "br"
+    assert _negotiate_encoding(request(accept_encoding="br;q=0, gzip")) == "gzip"
+    assert _negotiate_encoding(request(accept_encoding="br; q=0.0, gzip;q=0")) is None
+    assert _negotiate_encoding(request()) is None
+
+    monkeypatch.setattr(fast_response, "brotli", None)
+    assert _negotiate_encoding(request(accept_encoding="br, gzip")) == "gzip"
+    assert _negotiate_encoding(request(accept_encoding="br")) is None
+
+
+def test_to_columnar():
+    rows = [{"id": 1, "lat": 1.5}, {"id": 2, "lat": None}]
+    assert to_columnar(rows, ("id", "lat")) == {
+        "fields": ["id", "lat"],
+        "columns": {"id": [1, 2], "lat": [1.5, None]},
+        "count": 2,
+    }
+    assert to_columnar([], ("id",)) == {"fields": ["id"], "columns": {"id": []}, "count": 0}
+
+
+def test_encoded_response_compresses_large_body_only(monkeypatch):
+    monkeypatch.setattr(fast_response, "brotli", None)
+    small = encoded_response(request(accept_encoding="gzip"), {"a": 1}, '"e1"')
+    assert "content-encoding" not in small.headers
+    assert small.headers["etag"] == 'W/"e1"'
+
+    data = [{"id": i, "name": "vehicle"} for i in range(200)]
+    large = encoded_response(request(accept_encoding="gzip"), data, '"e1"')
+    assert large.headers["content-encoding"] == "gzip"
+    assert large.headers["vary"] == "Accept-Encoding"
+    assert json.loads(gzip.decompress(large.body)) == data
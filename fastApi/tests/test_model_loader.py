@@ -0,0 +1,31 @@
+import os
+
+import pytest
+
+joblib = pytest.importorskip("joblib")
+pytest.importorskip("numpy")
+
+from model_loader import bundle_is_current, load_model, mmap_bundle_path  # noqa: E402
+
+
+def test_bundle_rebuilt_when_model_replaced_with_older_mtime(tmp_path):
+    model_path = str(tmp_path / "crashmodel.pkl")
+    joblib.dump({"version": 1}, model_path)
+    assert load_model(model_path) == {"version": 1}
+    assert bundle_is_current(model_path)
+
+    # Model pengganti dengan mtime lama (cp -p / git checkout / rsync -t)
+    stat = os.stat(mmap_bundle_path(model_path))
+    joblib.dump({"version": 2, "extra": "x"}, model_path)
+    os.utime(model_path, ns=(stat.st_atime_ns, stat.st_mtime_ns - 10**9))
+    assert not bundle_is_current(model_path)
+    assert load_model(model_path) == {"version": 2, "extra": "x"}
+    assert bundle_is_current(model_path)
+
+
+def test_missing_signature_forces_export(tmp_path):
+    model_path = str(tmp_path / "crashmodel.pkl")
+    joblib.dump({"version": 1}, model_path)
+    load_model(model_path)
+    os.remove(mmap_bundle_path(model_path) + ".source.json")
+    assert not bundle_is_current(model_path)
@@ -0,0 +1,156 @@
+import json
+import os
+import threading
+import time
+
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("joblib")
+
+import model_registry as registry_module  # noqa: E402
+from model_registry import (  # noqa: E402
+    DEFAULT_VERSION, ModelLoadError, ModelRegistry, aggregate_shadow_stats,
+)
+from versions import DataVersions  # noqa: E402
+
+
+class ConstModel:
+    def __init__(self, value):
+        self.value = value
+
+    def predict(self, features):
+        return np.full(len(features), self.value)
+
+
+class StubLoader:
+    """Pengganti CrashModelLoader: model dipilih dari nama file, tanpa joblib"""
+    models = {}
+
+    def __init__(self, model_path):
+        self.model_path = model_path
+        self.model = None
+        self.error = None
+        self._ready = threading.Event()
+
+    def start(self):
+        if self._ready.is_set():
+            return
+        model = self.models.get(os.path.basename(self.model_path))
+        if model is None:
+            self.error = f"cannot load {self.model_path}"
+        self.model = model
+        self._ready.set()
+
+    def get(self, timeout=None):
+        self.start()
+        return self.model
+
+    def status(self):
+        return {"model_path": self.model_path, "ready": self.model is not None, "error": self.error}
+
+
+@pytest.fixture
+def env(tmp_path, monkeypatch):
+    models_dir = tmp_path / "models_store"
+    models_dir.mkdir()
+    for name in ("v2", "broken"):
+        (models_dir / f"{name}.pkl").write_bytes(b"")
+    monkeypatch.setattr(StubLoader, "models", {"crashmodel.pkl": ConstModel(0), "v2.pkl": ConstModel(1)})
+    monkeypatch.setattr(registry_module, "CrashModelLoader", StubLoader)
+    monkeypatch.setattr(registry_module, "crash_model_loader", StubLoader("crashmodel.pkl"))
+    monkeypatch.setattr(registry_module, "data_versions", DataVersions(str(tmp_path / "versions.bin")))
+
+    def make_registry():
+        # Satu registry = satu worker uvicorn, semua berbagi file yang sama
+        return ModelRegistry(str(models_dir), str(tmp_path / "model_state.json"), str(tmp_path / "shadow"))
+    return make_registry
+
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "condition not reached"
+        time.sleep(0.01)
+
+
+def test_hot_swap_is_shared_with_other_workers(env):
+    worker_a, worker_b = env(), env()
+    worker_a.warm_up()
+    worker_b.warm_up()
+    assert worker_b.active()[0] == DEFAULT_VERSION
+
+    assert worker_a.activate("v2") == DEFAULT_VERSION
+    assert worker_a.active()[0] == "v2"
+    # Worker lain melihat slot "models" berubah dan swap di background
+    wait_for(lambda: worker_b.active()[0] == "v2")
+    assert worker_b.active()[1].value == 1
+
+    # Setelah restart versi tersimpan langsung dipakai lagi
+    restarted = env()
+    restarted.warm_up()
+    assert restarted.active()[0] == "v2"
+
+
+def test_saved_model_failing_to_load_falls_back_to_default(env):
+    env()._write_state(active="broken")
+    worker = env()
+    worker.warm_up()
+    version, model = worker.active()
+    assert version == DEFAULT_VERSION
+    assert model.value == 0
+
+
+def test_failed_activation_keeps_active_model_usable(env):
+    worker = env()
+    worker.warm_up()
+    for _ in range(2):
+        with pytest.raises(ModelLoadError):
+            worker.activate("broken")
+        version, model = worker.active()
+        assert version == DEFAULT_VERSION and model is not None
+
+
+def test_reactivating_failed_active_version_does_not_break_active(env):
+    env()._write_state(active="broken")
+    worker = env()
+    worker.warm_up()
+    # activate() saat versi aktif masih "broken" (belum fallback) tidak boleh
+    # membuang loader versi aktif
+    with pytest.raises(ModelLoadError):
+        worker.activate("broken")
+    assert worker.active()[0] == DEFAULT_VERSION
+
+
+def test_shadow_stats_aggregated_across_workers(env):
+    worker_a, worker_b = env(), env()
+    worker_a.warm_up()
+    worker_b.warm_up()
+    session = worker_a.start_shadow("v2")
+    # Worker lain mengikuti lewat sync() di jalur scoring
+    wait_for(lambda: worker_b.active() and worker_b.shadow is not None and worker_b.shadow.session == session)
+
+    features = np.zeros((4, 6))
+    for worker in (worker_a, worker_b):
+        worker.record(DEFAULT_VERSION, features, np.zeros(4, dtype=bool), 0.001)
+    wait_for(lambda: worker_a.shadow.stats()["samples"] == 4 and worker_b.shadow.stats()["samples"] == 4)
+
+    # Dua registry di satu proses berbagi pid (satu file stats), jadi yang
+    # terakhir persist yang terhitung
+    stats = worker_a.stop_shadow()
+    assert stats["session"] == session and stats["workers"] == 1
+    assert stats["samples"] == 4
+    assert stats["candidate_only_accident"] == 4
+    wait_for(lambda: worker_b.active() and worker_b.shadow is None)
+
+
+def test_aggregate_shadow_stats_sums_worker_files(tmp_path):
+    for pid, samples in ((1, 10), (2, 5)):
+        with open(tmp_path / f"s1.{pid}.json", "w") as f:
+            json.dump({"pid": pid, "samples": samples, "agree": samples - 1}, f)
+    (tmp_path / "s1.3.json").write_text("not json")
+
+    stats = aggregate_shadow_stats("s1", str(tmp_path))
+    assert stats["workers"] == 2
+    assert stats["samples"] == 15 and stats["agree"] == 13
+    assert stats["agreementRate"] == round(13 / 15, 4)
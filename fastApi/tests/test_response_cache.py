@@ -0,0 +1,101 @@
+import pytest
+
+import response_cache as response_cache_module
+from response_cache import ResponseCache
+from versions import DataVersions
+
+
+@pytest.fixture
+def version_path(tmp_path):
+    return str(tmp_path / "data_versions.bin")
+
+
+@pytest.fixture
+def cache(version_path, monkeypatch):
+    monkeypatch.setattr(response_cache_module, "data_versions", DataVersions(version_path))
+    return ResponseCache()
+
+
+@pytest.fixture
+def other_worker(version_path):
+    # Worker lain membuka file versi yang sama lewat mmap sendiri
+    return DataVersions(version_path)
+
+
+def counting_loader(value):
+    calls = []
+
+    def loader():
+        calls.append(1)
+        return value
+    return loader, calls
+
+
+def test_hit_after_first_load(cache):
+    loader, calls = counting_loader("rows")
+    assert cache.get_or_load("k", ("vehicles",), loader) == "rows"
+    assert cache.get_or_load("k", ("vehicles",), loader) == "rows"
+    assert len(calls) == 1
+    assert cache.stats()["hits"] == 1
+
+
+def test_local_invalidation_drops_only_given_keys(cache):
+    cache.get_or_load("list", ("vehicles",), lambda: "list")
+    cache.get_or_load("one", ("vehicles",), lambda: "one")
+    cache.invalidate(("vehicles",), keys=["list"])
+
+    loader, calls = counting_loader("list v2")
+    assert cache.get_or_load("list", ("vehicles",), loader) == "list v2"
+    assert cache.get_or_load("one", ("vehicles",), lambda: "reloaded") == "one"
+    assert len(calls) == 1
+
+
+def test_foreign_write_detected_through_version_file(cache, other_worker):
+    cache.get_or_load("alerts", ("alerts",), lambda: "old")
+    cache.get_or_load("vehicles", ("vehicles",), lambda: "vehicles")
+    other_worker.bump("alerts")
+
+    assert cache.get_or_load("alerts", ("alerts",), lambda: "new") == "new"
+    # Tabel lain tidak ikut dibuang
+    assert cache.get_or_load("vehicles", ("vehicles",), lambda: "reloaded") == "vehicles"
+    assert cache.stats()["foreignFlushes"] == 1
+
+
+def test_foreign_write_between_local_writes_flushes_table(cache, other_worker):
+    cache.get_or_load("one", ("vehicles",), lambda: "one")
+    other_worker.bump("vehicles")
+    # invalidate lokal melihat versi melompat dan membuang semua entry tabelnya
+    cache.invalidate(("vehicles",), keys=["list"])
+    assert cache.get_or_load("one", ("vehicles",), lambda: "one v2") == "one v2"
+
+
+@pytest.mark.parametrize("writer", ["local", "foreign"])
+def test_load_overlapping_write_is_not_cached(cache, other_worker, writer):
+    def loader():
+        # Write terjadi saat loader masih membaca data lama
+        if writer == "local":
+            cache.invalidate(("payload",), keys=["map"])
+        else:
+            other_worker.bump("payload")
+        return "stale"
+
+    assert cache.get_or_load("map", ("payload",), loader) == "stale"
+    assert cache.get_or_load("map", ("payload",), lambda: "fresh") == "fresh"
+    assert cache.get_or_load("map", ("payload",), lambda: "unused") == "fresh"
+
+
+def test_ttl_and_lru_eviction(cache, monkeypatch):
+    small = ResponseCache(max_entries=2, ttl=60)
+    small.get_or_load("a", ("vehicles",), lambda: 1)
+    small.get_or_load("b", ("vehicles",), lambda: 2)
+    small.get_or_load("a", ("vehicles",), lambda: 0)
+    small.get_or_load("c", ("vehicles",), lambda: 3)
+    assert small.get_or_load("b", ("vehicles",), lambda: "reloaded") == "reloaded"
+    assert small.stats()["evictions"] >= 1
+
+    clock = [1000.0]
+    monkeypatch.setattr(response_cache_module.time, "monotonic", lambda: clock[0])
+    small.get_or_load("d", ("vehicles",), lambda: 4)
+    clock[0] += 61
+    assert small.get_or_load("d", ("vehicles",), lambda: 5) == 5
+    assert small.stats()["expirations"] == 1
@@ -0,0 +1,51 @@
+from datetime import datetime
+
+import pytest
+
+sqlalchemy = pytest.importorskip("sqlalchemy")
+pytest.importorskip("fastapi")
+pytest.importorskip("paho.mqtt")
+pytest.importorskip("pymysql")
+
+from sqlalchemy import create_engine, event  # noqa: E402
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+from sqlalchemy.pool import StaticPool  # noqa: E402
+
+import main  # noqa: E402
+import models  # noqa: E402
+
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite://", poolclass=StaticPool)
+
+    @event.listens_for(engine, "connect")
+    def enable_foreign_keys(connection, _):
+        # SQLite baru menegakkan FK kalau diaktifkan per koneksi
+        connection.execute("PRAGMA foreign_keys=ON")
+
+    models.Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+    yield session
+    session.close()
+
+
+def test_delete_vehicle_removes_telemetry_history(db):
+    vehicle = models.Vehicle(device_id="dev-1", vehicle_name="Truck", number_plate="B 1",
+                             driver_name="Driver", contact_number="0800")
+    db.add(vehicle)
+    db.commit()
+    now = datetime.utcnow()
+    db.add_all([
+        models.Payload(device_id="dev-1", timestamp=1, updated_at=now),
+        models.TelemetryHistory(device_id="dev-1", timestamp=1, received_at=now),
+        models.TelemetryHistory(device_id="dev-1", timestamp=2, received_at=now),
+    ])
+    db.commit()
+
+    result = main.delete_vehicle(vehicle.id, db)
+
+    assert result["deleted_history_count"] == 2
+    assert result["deleted_payload_count"] == 1
+    assert db.query(models.TelemetryHistory).count() == 0
+    assert db.query(models.Vehicle).count() == 0
@@ -0,0 +1,28 @@
+import os
+
+from versions import DataVersions
+
+
+def test_file_created_lazily_and_shared(tmp_path):
+    path = str(tmp_path / "data_versions.bin")
+    first = DataVersions(path)
+    assert not os.path.exists(path)
+
+    assert first.bump("alerts") == (1,)
+    assert os.path.exists(path)
+
+    # Worker lain melihat versi dan epoch yang sama lewat mmap
+    second = DataVersions(path)
+    assert second.get("alerts") == 1
+    assert second.epoch == first.epoch
+    assert second.etag("alerts", "vehicles", suffix="fast") == first.etag("alerts", "vehicles", suffix="fast")
+    assert first.etag("alerts").startswith(f'"{first.epoch:x}-1')
+
+
+def test_new_tables_keep_existing_slots(tmp_path):
+    path = str(tmp_path / "data_versions.bin")
+    old = DataVersions(path, tables=("vehicles",))
+    old.bump("vehicles")
+    grown = DataVersions(path, tables=("vehicles", "rules"))
+    assert grown.snapshot("vehicles", "rules") == (1, 0)
+    assert grown.epoch == old.epoch
@@ -0,0 +1,110 @@
+# versions.py - Data version counter per tabel (dipakai untuk ETag dan cache)
+import mmap
+import os
+import struct
+import threading
+
+from runtime_paths import data_path
+
+try:
+    import fcntl
+except ImportError:  # Windows - tidak ada lock antar proses
+    fcntl = None
+
+VERSION_FILE = data_path("data_versions.bin")
+
+# Setiap tabel punya satu slot uint64 di file versi
+TABLES = ("vehicles", "payload", "alerts", "rules", "models")
+_SLOT = struct.Struct("<Q")
+
+
+class DataVersions:
+    """Counter versi data yang di-share antar worker uvicorn lewat file mmap.
+
+    Setiap write path memanggil bump() untuk tabel yang diubah, sehingga
+    semua worker langsung melihat versi baru tanpa query ke database.
+    File baru dibuat / di-mmap saat pertama dipakai, bukan saat import.
+    """
+
+    def __init__(self, path=VERSION_FILE, tables=TABLES):
+        self.path = path
+        self.tables = tables
+        self._index = {name: i for i, name in enumerate(tables)}
+        self._lock = threading.Lock()
+        self._fd = None
+        self._mm = None
+
+    def _map(self):
+        mm = self._mm
+        if mm is not None:
+            return mm
+        with self._lock:
+            if self._mm is None:
+                self._open()
+            return self._mm
+
+    def _open(self):
+        # Slot 0 berisi epoch acak, supaya ETag lama tidak cocok lagi
+        # kalau file versi dibuat ulang (counter kembali ke 0).
+        # Create / resize dilakukan di bawah flock supaya worker yang start
+        # bersamaan tidak menulis epoch yang berbeda-beda.
+        size = _SLOT.size * (len(self.tables) + 1)
+        self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        self._file_lock()
+        try:
+            if os.fstat(self._fd).st_size < size:
+                # Slot yang sudah ada (termasuk epoch) tetap, slot baru berisi 0
+                os.ftruncate(self._fd, size)
+            mm = mmap.mmap(self._fd, size)
+            if _SLOT.unpack_from(mm, 0)[0] == 0:
+                _SLOT.pack_into(mm, 0, int.from_bytes(os.urandom(6), "little") or 1)
+        finally:
+            self._file_unlock()
+        self._mm = mm
+
+    def _file_lock(self):
+        if fcntl is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+
+    def _file_unlock(self):
+        if fcntl is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    @property
+    def epoch(self):
+        # Selalu dibaca dari mmap, bukan di-cache per proses
+        return _SLOT.unpack_from(self._map(), 0)[0]
+
+    def get(self, table):
+        offset = (self._index[table] + 1) * _SLOT.size
+        return _SLOT.unpack_from(self._map(), offset)[0]
+
+    def snapshot(self, *tables):
+        """Tuple versi untuk tabel-tabel yang jadi sumber sebuah response"""
+        return tuple(self.get(t) for t in tables)
+
+    def bump(self, *tables):
+        """Naikkan versi tabel, return tuple versi barunya"""
+        mm = self._map()
+        with self._lock:
+            self._file_lock()
+            try:
+                new_versions = []
+                for table in tables:
+                    offset = (self._index[table] + 1) * _SLOT.size
+                    value = _SLOT.unpack_from(mm, offset)[0] + 1
+                    _SLOT.pack_into(mm, offset, value)
+                    new_versions.append(value)
+                return tuple(new_versions)
+            finally:
+                self._file_unlock()
+
+    def etag(self, *tables, suffix=None):
+        """ETag dari epoch + versi tabel, suffix membedakan variasi response"""
+        parts = [format(self.epoch, "x")] + [str(v) for v in self.snapshot(*tables)]
+        if suffix:
+            parts.append(suffix)
+        return '"' + "-".join(parts) + '"'
+
+
+data_versions = DataVersions()